@@ -10,6 +10,7 @@ from .models import (
     Order,
     Contact,
     ConfirmEmailToken,
+    ImportJob,
 )
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
@@ -129,3 +130,10 @@ class ConfirmEmailTokenAdmin(admin.ModelAdmin):
         "key",
         "created_at",
     )
+
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = ("id", "url", "shop", "state", "goods_count",
+                    "created_at", "finished_at")
+    list_filter = ("state", "shop")
@@ -0,0 +1,72 @@
+import hashlib
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from rest_framework.response import Response
+
+CATALOG_VERSION_KEY = "catalog:version"
+
+
+def catalog_version():
+    """
+    Текущая версия данных каталога, входит в ключи кеша
+    """
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, 1, timeout=None)
+        version = cache.get(CATALOG_VERSION_KEY, 1)
+    return version
+
+
+def bump_catalog_version():
+    """
+    Сбрасываем кеш каталога, увеличивая его версию
+    """
+    try:
+        cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        cache.add(CATALOG_VERSION_KEY, 1, timeout=None)
+
+
+def catalog_cache_key(request):
+    """
+    Ключ кеша по адресу и отсортированным параметрам запроса.
+    Параметры хешируем: фильтры по названиям параметров бывают длинными
+    """
+    params = urlencode(sorted(
+        (key, value)
+        for key in request.query_params
+        for value in request.query_params.getlist(key)
+    ))
+    digest = hashlib.md5(params.encode()).hexdigest()
+    return (f"catalog:{catalog_version()}:{request.get_host()}"
+            f"{request.path}:{request.accepted_renderer.format}:{digest}")
+
+
+def cache_catalog_response(handler):
+    """
+    Кешируем данные успешного ответа каталога до смены версии.
+    Ответы, собранные без сериализаторов, кешируем готовыми байтами
+    """
+    @wraps(handler)
+    def wrapper(self, request, *args, **kwargs):
+        key = catalog_cache_key(request)
+        data = cache.get(key)
+        if isinstance(data, bytes):
+            return HttpResponse(data, content_type="application/json")
+        if data is not None:
+            return Response(data)
+        response = handler(self, request, *args, **kwargs)
+        # потоковую выгрузку не кешируем: она не собирается в памяти
+        if response.status_code == 200 and not response.streaming:
+            if isinstance(response, Response):
+                data = response.data
+            else:
+                data = response.content
+            cache.set(key, data, settings.CATALOG_CACHE_TIMEOUT)
+        return response
+
+    return wrapper
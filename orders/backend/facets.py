@@ -0,0 +1,78 @@
+import re
+
+from django.db import connection
+from django.db.models import Q, Sum
+
+from .models import ParameterFacet
+
+PARAM_FILTER = re.compile(r"^param\[(.+)\]$")
+
+
+def parameter_filters(query_params):
+    """
+    Собираем фильтры вида param[<название>]=<значение>.
+    Несколько значений одного параметра объединяются через ИЛИ
+    """
+    filters = {}
+    for key, values in query_params.lists():
+        match = PARAM_FILTER.match(key)
+        values = [value for value in values if value]
+        if match and values:
+            filters[match.group(1)] = values
+    return filters
+
+
+def filter_by_parameters(queryset, filters):
+    """
+    Оставляем записи каталога, у которых есть все выбранные значения
+    параметров. Вхождение в JSON обслуживает GIN-индекс jsonb_path_ops
+    """
+    for name, values in filters.items():
+        condition = Q()
+        for value in values:
+            condition |= Q(parameters__contains=[
+                {"parameter": name, "value": value}
+            ])
+        queryset = queryset.filter(condition)
+    return queryset
+
+
+def facet_counts(shop_id=None, category_id=None, queryset=None):
+    """
+    Возвращаем {параметр: {значение: число товаров}} для магазина
+    и категории из заранее посчитанной таблицы. Если выдача сужена
+    другими условиями, считаем по записям каталога из queryset
+    """
+    if queryset is not None:
+        # раскрываем JSON параметров отобранных записей каталога,
+        # не обращаясь к таблице параметров товаров
+        sql, params = (
+            queryset.order_by().values("parameters").query.sql_with_params()
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT item->>'parameter', item->>'value', COUNT(*) "
+                f"FROM ({sql}) AS items, "
+                "jsonb_array_elements(items.parameters) AS item "
+                "GROUP BY 1, 2 ORDER BY 1, 2",
+                params,
+            )
+            return _group_counts(cursor.fetchall())
+    facets = ParameterFacet.objects.filter(shop__state=True)
+    if shop_id:
+        facets = facets.filter(shop_id=shop_id)
+    if category_id:
+        facets = facets.filter(category_id=category_id)
+    rows = (
+        facets.values_list("parameter__name", "value")
+        .annotate(total=Sum("count"))
+        .order_by("parameter__name", "value")
+    )
+    return _group_counts(rows)
+
+
+def _group_counts(rows):
+    counts = {}
+    for name, value, total in rows:
+        counts.setdefault(name, {})[value] = total
+    return counts
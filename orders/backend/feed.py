@@ -0,0 +1,154 @@
+import gzip
+import hashlib
+import time
+from collections import namedtuple
+from tempfile import SpooledTemporaryFile
+
+import requests
+from django.conf import settings
+from yaml import (
+    DocumentStartEvent,
+    MappingEndEvent,
+    MappingStartEvent,
+    ScalarEvent,
+    ScalarNode,
+    SequenceEndEvent,
+    SequenceStartEvent,
+    StreamStartEvent,
+)
+
+try:
+    from yaml import CSafeLoader as FeedLoader
+except ImportError:
+    from yaml import SafeLoader as FeedLoader
+
+RECORD_KINDS = {"categories": "category", "goods": "good"}
+GZIP_MAGIC = b"\x1f\x8b"
+
+FeedDownload = namedtuple(
+    "FeedDownload", ("file", "etag", "last_modified", "digest")
+)
+
+
+class FeedError(ValueError):
+    """
+    Ошибка формата прайса партнера
+    """
+
+
+def _expect(loader, event_class):
+    event = loader.get_event()
+    if not isinstance(event, event_class):
+        raise FeedError(f"Неверный формат прайса: {event}")
+    return event
+
+
+def _build(loader, event):
+    """
+    Собираем объект из событий парсера без построения дерева узлов
+    """
+    if isinstance(event, ScalarEvent):
+        tag = event.tag
+        if tag is None or tag == "!":
+            tag = loader.resolve(ScalarNode, event.value, event.implicit)
+        constructor = loader.yaml_constructors.get(tag)
+        if constructor is None:
+            raise FeedError(f"Неподдерживаемый тег: {tag}")
+        return constructor(loader, ScalarNode(tag, event.value,
+                                              style=event.style))
+    if isinstance(event, SequenceStartEvent):
+        items = []
+        while not loader.check_event(SequenceEndEvent):
+            items.append(_build(loader, loader.get_event()))
+        loader.get_event()
+        return items
+    if isinstance(event, MappingStartEvent):
+        mapping = {}
+        while not loader.check_event(MappingEndEvent):
+            key = _build(loader, loader.get_event())
+            mapping[key] = _build(loader, loader.get_event())
+        loader.get_event()
+        return mapping
+    raise FeedError(f"Неверный формат прайса: {event}")
+
+
+def iter_feed(stream):
+    """
+    Читаем прайс потоком событий и отдаем записи по одной:
+    ("shop", название), ("category", {...}), ("good", {...})
+    """
+    loader = FeedLoader(stream)
+    try:
+        _expect(loader, StreamStartEvent)
+        _expect(loader, DocumentStartEvent)
+        _expect(loader, MappingStartEvent)
+        while not loader.check_event(MappingEndEvent):
+            key = _build(loader, loader.get_event())
+            kind = RECORD_KINDS.get(key)
+            if kind and loader.check_event(SequenceStartEvent):
+                loader.get_event()
+                while not loader.check_event(SequenceEndEvent):
+                    yield kind, _build(loader, loader.get_event())
+                loader.get_event()
+            else:
+                yield key, _build(loader, loader.get_event())
+    finally:
+        loader.dispose()
+
+
+def open_feed(file):
+    """
+    Распаковываем прайс на лету, если он передан в формате gzip
+    """
+    magic = file.read(len(GZIP_MAGIC))
+    file.seek(0)
+    if magic == GZIP_MAGIC:
+        return gzip.GzipFile(fileobj=file, mode="rb")
+    return file
+
+
+def fetch_feed(url, etag="", last_modified=""):
+    """
+    Скачиваем прайс партнера условным запросом по частям во временный файл.
+    Возвращаем None, если прайс не изменился с прошлой загрузки
+    """
+    headers = {"Accept-Encoding": "gzip"}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    max_size = settings.IMPORT_FEED_MAX_SIZE
+    deadline = time.monotonic() + settings.IMPORT_FETCH_MAX_TIME
+
+    with requests.get(url, headers=headers, stream=True,
+                      timeout=settings.IMPORT_FETCH_TIMEOUT) as response:
+        if response.status_code == 304:
+            return None
+        response.raise_for_status()
+        if int(response.headers.get("Content-Length") or 0) > max_size:
+            raise FeedError("Превышен максимальный размер прайса")
+
+        file = SpooledTemporaryFile(max_size=settings.IMPORT_SPOOL_SIZE)
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            for chunk in response.iter_content(
+                    settings.IMPORT_FETCH_CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_size:
+                    raise FeedError("Превышен максимальный размер прайса")
+                if time.monotonic() > deadline:
+                    raise FeedError("Превышено время загрузки прайса")
+                digest.update(chunk)
+                file.write(chunk)
+        except BaseException:
+            file.close()
+            raise
+        file.seek(0)
+
+    return FeedDownload(
+        file=file,
+        etag=response.headers.get("ETag", ""),
+        last_modified=response.headers.get("Last-Modified", ""),
+        digest=digest.hexdigest(),
+    )
@@ -0,0 +1,32 @@
+from .serializers import OrderSerializer, ProductInfoSerializer
+
+PRODUCT_INFO_FIELDS = ProductInfoSerializer.Meta.fields
+ORDER_FIELDS = OrderSerializer.Meta.fields
+# связи, которые раскрываются через expand
+CATALOG_EXPAND = ("product_parameters",)
+ORDER_EXPAND = ("ordered_items", "product_info", "product_parameters",
+                "contact")
+
+
+def _split_names(value):
+    return [name.strip() for name in value.split(",") if name.strip()]
+
+
+def parse_fieldset(query_params, fields, expandable):
+    """
+    Разбираем ?fields= и ?expand=. Без fields выводим все поля в порядке
+    сериализатора, без expand раскрываем все связи.
+    Неизвестное имя поля или связи вызывает ValueError
+    """
+    selected = fields
+    if "fields" in query_params:
+        names = _split_names(query_params["fields"])
+        if not set(names) <= set(fields):
+            raise ValueError(names)
+        selected = tuple(field for field in fields if field in names)
+    expand = frozenset(expandable)
+    if "expand" in query_params:
+        expand = frozenset(_split_names(query_params["expand"]))
+        if not expand <= set(expandable):
+            raise ValueError(expand)
+    return selected, expand
@@ -0,0 +1,685 @@
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.postgres.aggregates import JSONBAgg
+from django.db import connection, transaction
+from django.db.models import Count, Exists, F, OuterRef, Subquery
+from django.db.models.functions import JSONObject
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from .cache import bump_catalog_version
+from .feed import FeedError
+from .models import (
+    CatalogItem,
+    Category,
+    ImportItem,
+    ImportJob,
+    ParameterFacet,
+    ProductInfo,
+    Product,
+    Parameter,
+    ProductParameter,
+    Shop,
+)
+from .search import refresh_search_index
+from .serializers import CatalogItemSerializer
+from .totals import refresh_basket_prices
+from .versions import bump_catalog_versions
+
+BATCH_SIZE = 1000
+SYNC_FIELDS = ("product_id", "model", "price", "price_rrc", "quantity")
+CATALOG_FIELDS = ("shop_id", "shop_state", "category_id", "category_name",
+                  "product_name", "model", "quantity", "price", "price_rrc",
+                  "parameters", "fragment")
+# первый ключ рекомендательной блокировки Postgres для импорта прайсов
+IMPORT_LOCK_NAMESPACE = 1001
+JOB_COUNTERS = {
+    "goods": "goods_count",
+    "created": "created_count",
+    "updated": "updated_count",
+    "unchanged": "unchanged_count",
+    "deleted": "deleted_count",
+}
+# удаления импорта: версии, каталог и фасеты магазина импорт
+# пересчитывает сам, и обработчики сигналов эти строки пропускают
+_import_deletes = ContextVar("import_deletes", default=False)
+
+
+def _chunks(items, size=BATCH_SIZE):
+    """
+    Делим список на части фиксированного размера
+    """
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+@contextmanager
+def measure(timings, stage):
+    """
+    Прибавляем время выполнения блока к этапу импорта
+    """
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        timings[stage] += time.monotonic() - started
+
+
+@contextmanager
+def import_deletes():
+    """
+    Отмечаем удаления, которые выполняет импорт
+    """
+    token = _import_deletes.set(True)
+    try:
+        yield
+    finally:
+        _import_deletes.reset(token)
+
+
+def deleted_by_import():
+    """
+    Удаление выполняет импорт, а не админка или каскад от других данных
+    """
+    return _import_deletes.get()
+
+
+def record_progress(job_id, summary=None, timings=None, **fields):
+    """
+    Прибавляем счетчики и время этапов к задаче импорта.
+    Части прайса пишутся параллельно, поэтому обновляем через F()
+    """
+    if not job_id:
+        return
+    for key, value in (summary or {}).items():
+        if key in JOB_COUNTERS:
+            field = JOB_COUNTERS[key]
+            fields[field] = F(field) + value
+    for stage, value in (timings or {}).items():
+        fields[stage] = F(stage) + value
+    ImportJob.objects.filter(id=job_id).update(**fields)
+
+
+def _parameter_names(goods):
+    return {name for item in goods for name in item["parameters"]}
+
+
+class ImportCache:
+    """
+    Справочники на время импорта прайса: id категорий магазина,
+    (название, категория) -> id продукта и название -> id параметра.
+    Повторные обращения не идут в базу, промахи добираются
+    и создаются пачками. Без preload справочники не загружаются
+    заранее, и в базу идут только промахи
+    """
+
+    def __init__(self, shop, preload=True):
+        self.shop = shop
+        self.categories = set()
+        self.parameters = {}
+        self.products = {}
+        if not preload:
+            return
+        self.categories.update(
+            Category.objects.filter(shops=shop.id)
+            .values_list("id", flat=True)
+        )
+        self.parameters.update(
+            Parameter.objects.order_by("-id").values_list("name", "id")
+        )
+        rows = (
+            Product.objects.filter(product_infos__shop_id=shop.id)
+            .order_by("-id")
+            .values_list("name", "category_id", "id")
+            .distinct()
+        )
+        for name, category_id, product_id in rows:
+            self.products[(name, category_id)] = product_id
+
+    def link_categories(self, categories):
+        """
+        Создаем недостающие категории и привязываем их к магазину
+        """
+        names = {
+            category["id"]: category["name"]
+            for category in categories
+            if category["id"] not in self.categories
+        }
+        if not names:
+            return
+        existing = set(
+            Category.objects.filter(id__in=names)
+            .values_list("id", flat=True)
+        )
+        Category.objects.bulk_create(
+            [
+                Category(id=category_id, name=name)
+                for category_id, name in names.items()
+                if category_id not in existing
+            ],
+            batch_size=BATCH_SIZE,
+        )
+        Category.shops.through.objects.bulk_create(
+            [
+                Category.shops.through(category_id=category_id,
+                                       shop_id=self.shop.id)
+                for category_id in names
+            ],
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+        self.categories.update(names)
+
+    def resolve_products(self, goods):
+        """
+        Возвращаем словарь (название, категория) -> id продукта,
+        создавая недостающие продукты одним запросом на пачку
+        """
+        missing = list(
+            {(item["name"], item["category"]) for item in goods}
+            - self.products.keys()
+        )
+        for chunk in _chunks(missing):
+            rows = (
+                Product.objects.filter(
+                    name__in={name for name, _ in chunk},
+                    category_id__in={category_id for _, category_id in chunk},
+                )
+                .order_by("-id")
+                .values_list("name", "category_id", "id")
+            )
+            for name, category_id, product_id in rows:
+                self.products[(name, category_id)] = product_id
+
+        created = Product.objects.bulk_create(
+            [
+                Product(name=name, category_id=category_id)
+                for name, category_id in missing
+                if (name, category_id) not in self.products
+            ],
+            batch_size=BATCH_SIZE,
+        )
+        for product in created:
+            self.products[(product.name, product.category_id)] = product.id
+        return self.products
+
+    def resolve_parameters(self, names):
+        """
+        Возвращаем словарь название -> id параметра,
+        создавая недостающие параметры одним запросом
+        """
+        missing = set(names) - self.parameters.keys()
+        for chunk in _chunks(list(missing)):
+            rows = (
+                Parameter.objects.filter(name__in=chunk)
+                .order_by("-id")
+                .values_list("name", "id")
+            )
+            for name, parameter_id in rows:
+                self.parameters[name] = parameter_id
+        created = Parameter.objects.bulk_create(
+            [
+                Parameter(name=name)
+                for name in missing - self.parameters.keys()
+            ],
+            batch_size=BATCH_SIZE,
+        )
+        for parameter in created:
+            self.parameters[parameter.name] = parameter.id
+        return self.parameters
+
+
+def _item_values(item, products):
+    return {
+        "product_id": products[(item["name"], item["category"])],
+        "model": item["model"],
+        "price": item["price"],
+        "price_rrc": item["price_rrc"],
+        "quantity": item["quantity"],
+    }
+
+
+def _item_parameters(item, parameters):
+    return {
+        parameters[name]: str(value)
+        for name, value in item["parameters"].items()
+    }
+
+
+def _product_parameters(pairs):
+    return [
+        ProductParameter(
+            product_info_id=product_info.id,
+            parameter_id=parameter_id,
+            value=value,
+        )
+        for product_info, item_parameters in pairs
+        for parameter_id, value in item_parameters.items()
+    ]
+
+
+def sync_goods(cache, goods, stale, timings):
+    """
+    Сравниваем пачку товаров с сохраненными по (магазин, внешний ИД):
+    создаем новые, обновляем только изменившиеся.
+    Встреченные внешние ИД убираем из множества stale
+    """
+    shop = cache.shop
+    with measure(timings, "write_time"):
+        products = cache.resolve_products(goods)
+        parameters = cache.resolve_parameters(_parameter_names(goods))
+
+    with measure(timings, "diff_time"):
+        created, changed, reparametrized, new_parameters = _diff_goods(
+            shop, goods, stale, products, parameters
+        )
+
+    with measure(timings, "write_time"):
+        ProductInfo.objects.bulk_create(created, batch_size=BATCH_SIZE)
+        ProductInfo.objects.bulk_update(changed, SYNC_FIELDS,
+                                        batch_size=BATCH_SIZE)
+        with import_deletes():
+            ProductParameter.objects.filter(
+                product_info_id__in=reparametrized).delete()
+        ProductParameter.objects.bulk_create(
+            _product_parameters(new_parameters), batch_size=BATCH_SIZE
+        )
+        refresh_basket_prices([info.id for info in changed])
+        touched = {info.id for info in changed}.union(reparametrized)
+        refresh_catalog(ProductInfo.objects.filter(
+            id__in=touched.union(info.id for info in created)
+        ))
+    updated = len(touched)
+    return {
+        "created": len(created),
+        "updated": updated,
+        "unchanged": len(goods) - len(created) - updated,
+    }
+
+
+def _diff_goods(shop, goods, stale, products, parameters):
+    existing = {
+        product_info.external_id: product_info
+        for product_info in ProductInfo.objects.filter(
+            shop_id=shop.id,
+            external_id__in=[item["id"] for item in goods],
+        ).only("id", "external_id", *SYNC_FIELDS)
+    }
+    existing_parameters = defaultdict(dict)
+    rows = ProductParameter.objects.filter(
+        product_info_id__in=[info.id for info in existing.values()]
+    ).values_list("product_info_id", "parameter_id", "value")
+    for product_info_id, parameter_id, value in rows:
+        existing_parameters[product_info_id][parameter_id] = value
+
+    created = []
+    changed = []
+    reparametrized = []
+    new_parameters = []
+    for item in goods:
+        stale.discard(item["id"])
+        values = _item_values(item, products)
+        item_parameters = _item_parameters(item, parameters)
+        product_info = existing.get(item["id"])
+        if product_info is None:
+            product_info = ProductInfo(external_id=item["id"],
+                                       shop_id=shop.id, **values)
+            created.append(product_info)
+            new_parameters.append((product_info, item_parameters))
+            continue
+        if any(getattr(product_info, field) != value
+               for field, value in values.items()):
+            for field, value in values.items():
+                setattr(product_info, field, value)
+            changed.append(product_info)
+        if existing_parameters[product_info.id] != item_parameters:
+            reparametrized.append(product_info.id)
+            new_parameters.append((product_info, item_parameters))
+    return created, changed, reparametrized, new_parameters
+
+
+def delete_stale(shop, stale):
+    """
+    Удаляем товары магазина, которых нет в новом прайсе
+    """
+    deleted = 0
+    with import_deletes():
+        for chunk in _chunks(list(stale)):
+            deleted += ProductInfo.objects.filter(
+                shop_id=shop.id, external_id__in=chunk
+            ).delete()[1].get(ProductInfo._meta.label, 0)
+    return deleted
+
+
+def _write_catalog(items):
+    renderer = JSONRenderer()
+    data = CatalogItemSerializer(items, many=True).data
+    for item, item_data in zip(items, data):
+        item.fragment = renderer.render(item_data).decode()
+    CatalogItem.objects.bulk_create(
+        items,
+        update_conflicts=True,
+        unique_fields=["product_info"],
+        update_fields=CATALOG_FIELDS,
+    )
+    refresh_search_index(CatalogItem.objects.filter(
+        product_info_id__in=[item.product_info_id for item in items]
+    ))
+
+
+def refresh_catalog(product_infos):
+    """
+    Пересчитываем записи каталога для чтения по товарам:
+    данные магазина, продукта, категории и параметры одной строкой,
+    а также готовый JSON записи для списка товаров
+    """
+    parameters = (
+        ProductParameter.objects.filter(product_info_id=OuterRef("id"))
+        .order_by()
+        .values("product_info_id")
+        .annotate(items=JSONBAgg(
+            JSONObject(parameter="parameter__name", value="value"),
+            ordering="id",
+        ))
+        .values("items")
+    )
+    rows = product_infos.order_by().values(
+        "id", "shop_id", "model", "quantity", "price", "price_rrc",
+        shop_state=F("shop__state"),
+        category_id=F("product__category_id"),
+        category_name=F("product__category__name"),
+        product_name=F("product__name"),
+        parameters=Subquery(parameters),
+    )
+    items = []
+    for row in rows.iterator(chunk_size=BATCH_SIZE):
+        items.append(CatalogItem(
+            product_info_id=row.pop("id"),
+            **dict(row, parameters=row["parameters"] or []),
+        ))
+        if len(items) >= BATCH_SIZE:
+            _write_catalog(items)
+            items = []
+    if items:
+        _write_catalog(items)
+
+
+def rebuild_facets(shop_id):
+    """
+    Пересчитываем число товаров магазина по значениям параметров
+    в каждой категории
+    """
+    ParameterFacet.objects.filter(shop_id=shop_id).delete()
+    rows = (
+        ProductParameter.objects.filter(product_info__shop_id=shop_id)
+        .order_by()
+        .values("product_info__product__category_id", "parameter_id",
+                "value")
+        .annotate(count=Count("id"))
+    )
+    ParameterFacet.objects.bulk_create(
+        [
+            ParameterFacet(
+                shop_id=shop_id,
+                category_id=row["product_info__product__category_id"],
+                parameter_id=row["parameter_id"],
+                value=row["value"],
+                count=row["count"],
+            )
+            for row in rows
+        ],
+        batch_size=BATCH_SIZE,
+    )
+
+
+def import_feed(records, user_id, timings=None):
+    """
+    Загружаем прайс партнера из потока записей за одну транзакцию,
+    записывая товары пачками по мере чтения.
+    Изменяем только отличающиеся товары
+    """
+    shop = None
+    cache = None
+    categories = []
+    batch = []
+    stale = set()
+    summary = {"goods": 0, "created": 0, "updated": 0, "unchanged": 0,
+               "deleted": 0}
+    if timings is None:
+        timings = defaultdict(float)
+
+    def write(goods):
+        summary["goods"] += len(goods)
+        result = sync_goods(cache, goods, stale, timings)
+        for key, value in result.items():
+            summary[key] += value
+
+    with transaction.atomic():
+        for kind, record in records:
+            if kind == "shop":
+                shop, _ = Shop.objects.get_or_create(name=record,
+                                                     user_id=user_id)
+                cache = ImportCache(shop)
+                stale = set(
+                    ProductInfo.objects.filter(shop_id=shop.id)
+                    .values_list("external_id", flat=True)
+                )
+            elif kind == "category":
+                categories.append(record)
+            elif kind == "good":
+                if shop is None:
+                    raise FeedError("Магазин не указан до списка товаров")
+                if categories:
+                    cache.link_categories(categories)
+                    categories = []
+                batch.append(record)
+                if len(batch) >= BATCH_SIZE:
+                    write(batch)
+                    batch = []
+        if shop is None:
+            raise FeedError("Магазин не указан")
+        if categories:
+            cache.link_categories(categories)
+        if batch:
+            write(batch)
+        with measure(timings, "cleanup_time"):
+            summary["deleted"] = delete_stale(shop, stale)
+            rebuild_facets(shop.id)
+        bump_catalog_versions([shop.id])
+        transaction.on_commit(bump_catalog_version)
+    return {"shop_id": shop.id, **summary}
+
+
+def _timed(records, timings, stage):
+    """
+    Отдаем записи потока, прибавляя время их чтения к этапу импорта
+    """
+    iterator = iter(records)
+    while True:
+        with measure(timings, stage):
+            record = next(iterator, None)
+        if record is None:
+            return
+        yield record
+
+
+def prepare_import(records, user_id, job_id, chunk_size=BATCH_SIZE,
+                   timings=None):
+    """
+    Подготовительный этап параллельного импорта: создаем магазин,
+    категории, продукты и параметры, а товары пачками по мере чтения
+    складываем в ImportItem с номером части. Возвращаем число частей.
+    Все это запись, diff_time остается сравнению в частях
+    """
+    shop = None
+    cache = None
+    categories = []
+    batch = []
+    count = 0
+    if timings is None:
+        timings = defaultdict(float)
+
+    def stage(goods):
+        products = cache.resolve_products(goods)
+        cache.resolve_parameters(_parameter_names(goods))
+        ImportItem.objects.bulk_create(
+            [
+                ImportItem(
+                    job_id=job_id,
+                    chunk=(count + number) // chunk_size,
+                    external_id=item["id"],
+                    data=dict(item, product_id=products[(item["name"],
+                                                         item["category"])]),
+                )
+                for number, item in enumerate(goods)
+            ],
+            batch_size=BATCH_SIZE,
+        )
+        return len(goods)
+
+    with transaction.atomic():
+        for kind, record in _timed(records, timings, "parse_time"):
+            if kind == "shop":
+                with measure(timings, "write_time"):
+                    shop, _ = Shop.objects.get_or_create(name=record,
+                                                         user_id=user_id)
+                    cache = ImportCache(shop)
+            elif kind == "category":
+                categories.append(record)
+            elif kind == "good":
+                if shop is None:
+                    raise FeedError("Магазин не указан до списка товаров")
+                batch.append(record)
+                if len(batch) >= BATCH_SIZE:
+                    with measure(timings, "write_time"):
+                        cache.link_categories(categories)
+                        categories = []
+                        count += stage(batch)
+                    batch = []
+        if shop is None:
+            raise FeedError("Магазин не указан")
+        with measure(timings, "write_time"):
+            cache.link_categories(categories)
+            if batch:
+                count += stage(batch)
+            bump_catalog_versions([shop.id])
+    return {"shop_id": shop.id, "chunks": -(-count // chunk_size)}
+
+
+def write_chunk(shop_id, job_id, chunk):
+    """
+    Записываем часть прайса из ImportItem в отдельной транзакции
+    """
+    timings = defaultdict(float)
+    goods = list(
+        ImportItem.objects.filter(job_id=job_id, chunk=chunk)
+        .order_by("id")
+        .values_list("data", flat=True)
+    )
+    # справочники всего магазина не загружаем: продукты созданы
+    # на подготовительном этапе, и части, которые пишутся параллельно,
+    # не создают одинаковые продукты, а параметры части добираются
+    # одним запросом
+    cache = ImportCache(Shop.objects.get(id=shop_id), preload=False)
+    for item in goods:
+        cache.products[(item["name"], item["category"])] = item["product_id"]
+    with transaction.atomic():
+        summary = sync_goods(cache, goods, set(), timings)
+        summary["goods"] = len(goods)
+        record_progress(job_id, summary, timings)
+        bump_catalog_versions([shop_id])
+        transaction.on_commit(bump_catalog_version)
+    return summary
+
+
+def finalize_import(results, shop_id, job_id, feed_state=None):
+    """
+    Удаляем товары магазина, которых не было в прайсе задачи,
+    запоминаем состояние загруженного прайса и собираем итог
+    по всем частям
+    """
+    timings = defaultdict(float)
+    shop = Shop.objects.get(id=shop_id)
+    summary = {"goods": 0, "created": 0, "updated": 0, "unchanged": 0}
+    for result in results:
+        for key in summary:
+            summary[key] += result[key]
+    with transaction.atomic():
+        with measure(timings, "cleanup_time"):
+            items = ImportItem.objects.filter(job_id=job_id)
+            stale = ProductInfo.objects.filter(shop_id=shop_id).filter(
+                ~Exists(items.filter(external_id=OuterRef("external_id")))
+            ).values_list("external_id", flat=True)
+            summary["deleted"] = delete_stale(shop, stale)
+            items.delete()
+            rebuild_facets(shop_id)
+        if feed_state:
+            Shop.objects.filter(id=shop_id).update(**feed_state)
+        record_progress(job_id, {"deleted": summary["deleted"]}, timings,
+                        state="done", finished_at=timezone.now())
+        bump_catalog_versions([shop_id])
+        transaction.on_commit(bump_catalog_version)
+    return {"shop_id": shop_id, **summary}
+
+
+def claim_job(job_id, user_id):
+    """
+    Занимаем импорт магазина для задачи под рекомендательной блокировкой.
+    Более старые задачи в очереди заменяются новой, одновременно
+    выполняется не больше одного импорта магазина, а импорт
+    с истекшей блокировкой отмечается упавшим.
+    Возвращаем новый статус задачи: running, queued или superseded.
+    None означает, что задача уже не в очереди: ее занял другой
+    вызов, например при повторной доставке, или она завершена
+    """
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_xact_lock(%s, %s)",
+                           [IMPORT_LOCK_NAMESPACE, user_id])
+        jobs = ImportJob.objects.filter(user_id=user_id)
+        job = jobs.get(id=job_id)
+        if job.state != "queued":
+            return None
+        if jobs.filter(state="queued", id__gt=job_id).exists():
+            jobs.filter(id=job_id).update(state="superseded",
+                                          finished_at=timezone.now())
+            return "superseded"
+        lock_expired = timezone.now() - timedelta(
+            seconds=settings.IMPORT_LOCK_TIMEOUT
+        )
+        # импорт, чья блокировка истекла, уже не завершится сам:
+        # воркер упал, и без этого очередь магазина не сдвинется
+        expired = list(
+            jobs.filter(state="running", started_at__lte=lock_expired)
+            .values_list("id", flat=True)
+        )
+        if expired:
+            jobs.filter(id__in=expired).update(
+                state="failed", error="Истек срок блокировки импорта",
+                finished_at=timezone.now()
+            )
+            ImportItem.objects.filter(job_id__in=expired).delete()
+        if jobs.filter(state="running").exists():
+            return "queued"
+        jobs.filter(state="queued", id__lt=job_id).update(
+            state="superseded", finished_at=timezone.now()
+        )
+        jobs.filter(id=job_id).update(state="running",
+                                      started_at=timezone.now())
+    return "running"
+
+
+def next_job(user_id):
+    """
+    Возвращаем самую старую задачу магазина, ожидающую в очереди
+    """
+    return (
+        ImportJob.objects.filter(user_id=user_id, state="queued")
+        .order_by("id")
+        .first()
+    )
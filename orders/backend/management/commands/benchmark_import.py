@@ -0,0 +1,104 @@
+import time
+import tracemalloc
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from backend.feed import iter_feed, open_feed
+from backend.importer import (
+    finalize_import,
+    import_feed,
+    prepare_import,
+    write_chunk,
+)
+from backend.models import ImportJob, ProductInfo, Shop
+
+BENCHMARK_EMAIL = "benchmark@example.com"
+
+
+class QueryCounter:
+    """
+    Считаем запросы, не сохраняя их текст: большие пачки INSERT
+    и UPDATE иначе держались бы в памяти до конца прогона
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    """
+    Замеряем импорт прайса на локальной базе
+    """
+
+    help = ("Импортирует прайс несколько раз подряд и выводит время, "
+            "число запросов, скорость и пиковую память каждого прогона")
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Файл прайса")
+        parser.add_argument("--runs", type=int, default=2,
+                            help="Повторов; второй и далее без изменений")
+        parser.add_argument("--mode", choices=("stream", "chunks"),
+                            default="stream",
+                            help="Потоковый импорт или подготовка и "
+                                 "запись частями, как в Celery")
+        parser.add_argument("--chunk-size", type=int, default=1000)
+        parser.add_argument("--reset", action="store_true",
+                            help="Удалить товары тестового магазина "
+                                 "перед первым прогоном")
+        parser.add_argument("--no-memory", action="store_true",
+                            help="Не замерять пиковую память Python: "
+                                 "tracemalloc заметно замедляет импорт")
+
+    def handle(self, *args, **options):
+        user, _ = get_user_model().objects.get_or_create(
+            email=BENCHMARK_EMAIL,
+            defaults={"user_type": "shop", "username": "benchmark"},
+        )
+        if options["reset"]:
+            ProductInfo.objects.filter(shop__user=user).delete()
+            Shop.objects.filter(user=user).update(feed_digest="")
+
+        for run in range(1, options["runs"] + 1):
+            # пиковая память процесса не сбрасывается между прогонами,
+            # поэтому считаем пик выделений Python для каждого прогона
+            if not options["no_memory"]:
+                tracemalloc.start()
+            queries = QueryCounter()
+            started = time.perf_counter()
+            with connection.execute_wrapper(queries):
+                with open(options["path"], "rb") as file:
+                    summary = self._import(open_feed(file), user.id, options)
+            elapsed = time.perf_counter() - started
+            memory = ""
+            if not options["no_memory"]:
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                memory = f"peak python memory {peak / 1024 / 1024:.1f} MB, "
+
+            self.stdout.write(
+                f"run {run}: {elapsed:.2f} s, "
+                f"queries {queries.count}, "
+                f"{summary['goods'] / elapsed:.0f} rows/s, "
+                f"{memory}"
+                f"created {summary['created']}, "
+                f"updated {summary['updated']}, "
+                f"unchanged {summary['unchanged']}, "
+                f"deleted {summary['deleted']}"
+            )
+
+    @staticmethod
+    def _import(file, user_id, options):
+        if options["mode"] == "stream":
+            return import_feed(iter_feed(file), user_id)
+        job = ImportJob.objects.create(user_id=user_id, url="")
+        prepared = prepare_import(iter_feed(file), user_id, job.id,
+                                  options["chunk_size"])
+        results = [write_chunk(prepared["shop_id"], job.id, chunk)
+                   for chunk in range(prepared["chunks"])]
+        return finalize_import(results, prepared["shop_id"], job.id)
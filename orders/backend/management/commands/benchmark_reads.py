@@ -0,0 +1,114 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from backend.cache import bump_catalog_version
+from backend.models import Contact, Order, OrderItem, ProductInfo
+from backend.totals import update_order_totals
+from backend.views import BasketView, OrderView, PartnerOrders, ProductInfoView
+
+BUYER_EMAIL = "benchmark-buyer@example.com"
+
+
+class Command(BaseCommand):
+    """
+    Сравниваем чтение через values() и через сериализаторы DRF
+    """
+
+    help = ("Создает заказы тестового покупателя из имеющихся товаров и "
+            "замеряет ответы каталога, корзины и заказов разными способами")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--orders", type=int, default=50,
+                            help="Заказов у тестового покупателя")
+        parser.add_argument("--items", type=int, default=20,
+                            help="Позиций в каждом заказе и в корзине")
+        parser.add_argument("--runs", type=int, default=3,
+                            help="Повторов, выводится лучшее время")
+
+    def handle(self, *args, **options):
+        product_info = ProductInfo.objects.select_related("shop").first()
+        if product_info is None:
+            raise CommandError("Нет товаров, сначала импортируйте прайс")
+        buyer = self._seed(product_info.shop, options)
+        partner = product_info.shop.user
+        factory = APIRequestFactory()
+        cases = [
+            ("products", ProductInfoView, None,
+             ("fragments", "values", "serializer"),
+             {"page_size": settings.CATALOG_MAX_PAGE_SIZE}),
+            ("basket", BasketView, buyer, ("values", "serializer"), {}),
+            ("order", OrderView, buyer, ("values", "serializer"), {}),
+            ("partner/orders", PartnerOrders, partner,
+             ("values", "serializer"), {}),
+        ]
+        for name, view_class, user, read_paths, params in cases:
+            contents, best = {}, {}
+            for read_path in read_paths:
+                view = view_class.as_view(read_path=read_path,
+                                          throttle_classes=())
+                timings = []
+                for _ in range(options["runs"]):
+                    # каталог кешируется, новая версия обходит кеш
+                    bump_catalog_version()
+                    request = factory.get(f"/api/v1/{name}", params)
+                    if user is not None:
+                        force_authenticate(request, user=user)
+                    started = time.perf_counter()
+                    with CaptureQueriesContext(connection) as queries:
+                        response = view(request)
+                        # готовые фрагменты отдаются обычным HttpResponse
+                        if hasattr(response, "render"):
+                            response.render()
+                    timings.append(time.perf_counter() - started)
+                contents[read_path] = response.content
+                best[read_path] = min(timings)
+                self.stdout.write(
+                    f"{name} {read_path}: {best[read_path] * 1000:.1f} ms, "
+                    f"queries {len(queries)}, "
+                    f"{len(response.content)} bytes"
+                )
+            for read_path in read_paths[:-1]:
+                same = contents[read_path] == contents["serializer"]
+                self.stdout.write(
+                    f"{name} {read_path} vs serializer: "
+                    f"{best['serializer'] / best[read_path]:.1f}x faster, "
+                    f"{'identical' if same else 'different'}"
+                )
+
+    @staticmethod
+    def _seed(shop, options):
+        """
+        Пересоздаем заказы и корзину тестового покупателя
+        """
+        buyer, _ = get_user_model().objects.get_or_create(
+            email=BUYER_EMAIL,
+            defaults={"username": "benchmark-buyer", "is_active": True},
+        )
+        Order.objects.filter(user=buyer).delete()
+        contact, _ = Contact.objects.get_or_create(
+            user=buyer, city="Москва", street="Тверская", phone="+70000000000"
+        )
+        product_infos = list(
+            ProductInfo.objects.filter(shop=shop)
+            .order_by("id")
+            .values_list("id", "price")[:options["items"]]
+        )
+        orders = Order.objects.bulk_create(
+            [Order(user=buyer, state="new", contact=contact)
+             for _ in range(options["orders"])]
+            + [Order(user=buyer, state="basket")]
+        )
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, product_info_id=product_info_id,
+                      quantity=index % 5 + 1, price=price)
+            for order in orders
+            for index, (product_info_id, price) in enumerate(product_infos)
+        )
+        update_order_totals([order.id for order in orders])
+        return buyer
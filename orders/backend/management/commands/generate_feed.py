@@ -0,0 +1,82 @@
+import random
+
+from django.core.management.base import BaseCommand
+from yaml import dump as dump_yaml
+
+try:
+    from yaml import CSafeDumper as FeedDumper
+except ImportError:
+    from yaml import SafeDumper as FeedDumper
+
+COLORS = ("черный", "белый", "красный", "синий", "золотистый", "серебристый")
+
+
+class Command(BaseCommand):
+    """
+    Генерируем прайс в формате data/shop1.yaml заданного размера
+    """
+
+    help = "Генерирует синтетический прайс партнера для нагрузочных тестов"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Файл, в который пишем прайс")
+        parser.add_argument("--goods", type=int, default=10000)
+        parser.add_argument("--categories", type=int, default=20)
+        parser.add_argument("--parameters", type=int, default=4,
+                            help="Параметров у каждого товара")
+        parser.add_argument("--parameter-names", type=int, default=50,
+                            help="Размер словаря параметров")
+        parser.add_argument("--shop", default="Тестовый магазин")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        rand = random.Random(options["seed"])
+        categories = [
+            {"id": number, "name": f"Категория {number}"}
+            for number in range(1, options["categories"] + 1)
+        ]
+        parameter_names = [
+            f"Параметр {number}"
+            for number in range(1, options["parameter_names"] + 1)
+        ]
+        per_item = min(options["parameters"], len(parameter_names))
+
+        with open(options["path"], "w", encoding="utf-8") as file:
+            file.write(self._dump({"shop": options["shop"]}))
+            file.write(self._dump({"categories": categories}))
+            file.write("\ngoods:\n")
+            for number in range(1, options["goods"] + 1):
+                file.write(self._dump([self._good(rand, number, categories,
+                                                  parameter_names,
+                                                  per_item)],
+                                      indent="  "))
+
+        self.stdout.write(
+            f"Записано товаров: {options['goods']} в {options['path']}"
+        )
+
+    @staticmethod
+    def _good(rand, number, categories, parameter_names, per_item):
+        price = rand.randrange(100, 200000, 10)
+        return {
+            "id": number,
+            "category": rand.choice(categories)["id"],
+            "model": f"brand{number % 97}/model-{number % 1009}",
+            "name": f"Товар {number} ({rand.choice(COLORS)})",
+            "price": price,
+            "price_rrc": price + rand.randrange(0, 10000, 10),
+            "quantity": rand.randrange(0, 100),
+            "parameters": {
+                name: rand.choice((rand.randrange(1, 1000),
+                                   rand.choice(COLORS)))
+                for name in rand.sample(parameter_names, per_item)
+            },
+        }
+
+    @staticmethod
+    def _dump(data, indent=""):
+        text = dump_yaml(data, Dumper=FeedDumper, allow_unicode=True,
+                         sort_keys=False)
+        if indent:
+            text = "".join(indent + line for line in text.splitlines(True))
+        return text
@@ -0,0 +1,42 @@
+# Generated by Django 4.2 on 2026-10-18 05:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("backend", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name="order",
+            options={
+                "ordering": ("-created_at",),
+                "verbose_name": "Заказ",
+                "verbose_name_plural": "Список заказов",
+            },
+        ),
+        migrations.AddField(
+            model_name="shop",
+            name="feed_digest",
+            field=models.CharField(
+                blank=True, max_length=64, verbose_name="Хеш прайса"
+            ),
+        ),
+        migrations.AddField(
+            model_name="shop",
+            name="feed_etag",
+            field=models.CharField(
+                blank=True, max_length=255, verbose_name="ETag прайса"
+            ),
+        ),
+        migrations.AddField(
+            model_name="shop",
+            name="feed_last_modified",
+            field=models.CharField(
+                blank=True, max_length=64, verbose_name="Last-Modified прайса"
+            ),
+        ),
+    ]
@@ -0,0 +1,109 @@
+# Generated by Django 4.2 on 2026-10-18 05:23
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("backend", "0002_shop_feed_state"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ImportJob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("url", models.URLField(verbose_name="Ссылка")),
+                (
+                    "state",
+                    models.CharField(
+                        choices=[
+                            ("queued", "В очереди"),
+                            ("running", "Выполняется"),
+                            ("done", "Завершен"),
+                            ("skipped", "Прайс не изменился"),
+                            ("failed", "Ошибка"),
+                        ],
+                        default="queued",
+                        max_length=10,
+                        verbose_name="Статус",
+                    ),
+                ),
+                ("error", models.TextField(blank=True, verbose_name="Ошибка")),
+                (
+                    "goods_count",
+                    models.PositiveIntegerField(default=0, verbose_name="Товаров"),
+                ),
+                (
+                    "created_count",
+                    models.PositiveIntegerField(default=0, verbose_name="Создано"),
+                ),
+                (
+                    "updated_count",
+                    models.PositiveIntegerField(default=0, verbose_name="Обновлено"),
+                ),
+                (
+                    "unchanged_count",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Без изменений"
+                    ),
+                ),
+                (
+                    "deleted_count",
+                    models.PositiveIntegerField(default=0, verbose_name="Удалено"),
+                ),
+                (
+                    "fetch_time",
+                    models.FloatField(default=0, verbose_name="Загрузка, с"),
+                ),
+                ("parse_time", models.FloatField(default=0, verbose_name="Разбор, с")),
+                (
+                    "diff_time",
+                    models.FloatField(default=0, verbose_name="Сравнение, с"),
+                ),
+                ("write_time", models.FloatField(default=0, verbose_name="Запись, с")),
+                (
+                    "cleanup_time",
+                    models.FloatField(default=0, verbose_name="Очистка, с"),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("finished_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "shop",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="import_jobs",
+                        to="backend.shop",
+                        verbose_name="Магазин",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="import_jobs",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Пользователь",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Импорт прайса",
+                "verbose_name_plural": "Список импортов прайсов",
+                "ordering": ("-created_at",),
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2 on 2026-10-18 05:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("backend", "0003_importjob"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="importjob",
+            name="started_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name="importjob",
+            name="state",
+            field=models.CharField(
+                choices=[
+                    ("queued", "В очереди"),
+                    ("running", "Выполняется"),
+                    ("done", "Завершен"),
+                    ("skipped", "Прайс не изменился"),
+                    ("superseded", "Заменен более новым"),
+                    ("failed", "Ошибка"),
+                ],
+                default="queued",
+                max_length=10,
+                verbose_name="Статус",
+            ),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 4.2 on 2026-10-18 05:39
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+FILL_SEARCH_DATA = """
+UPDATE backend_productinfo AS info
+SET search_text = concat_ws(' ', product.name, info.model, parameters.text),
+    search_vector =
+        setweight(to_tsvector('russian', coalesce(product.name, '')), 'A')
+        || setweight(to_tsvector('russian', coalesce(info.model, '')), 'B')
+        || setweight(to_tsvector('russian', coalesce(parameters.text, '')),
+                     'C')
+FROM backend_product AS product,
+     backend_productinfo AS source
+     LEFT JOIN LATERAL (
+         SELECT string_agg(value, ' ') AS text
+         FROM backend_productparameter
+         WHERE product_info_id = source.id
+     ) AS parameters ON true
+WHERE product.id = info.product_id AND source.id = info.id
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("backend", "0004_importjob_started_at"),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name="productinfo",
+            name="search_text",
+            field=models.TextField(
+                blank=True, editable=False, verbose_name="Текст для поиска"
+            ),
+        ),
+        migrations.AddField(
+            model_name="productinfo",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True, verbose_name="Поисковый вектор"
+            ),
+        ),
+        migrations.RunSQL(FILL_SEARCH_DATA, migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name="productinfo",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["search_vector"], name="product_info_search_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="productinfo",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["search_text"],
+                name="product_info_search_trgm_idx",
+                opclasses=["gin_trgm_ops"],
+            ),
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 4.2 on 2026-10-18 06:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("backend", "0005_productinfo_search"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ParameterFacet",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("value", models.CharField(max_length=100, verbose_name="Значение")),
+                (
+                    "count",
+                    models.PositiveIntegerField(verbose_name="Количество товаров"),
+                ),
+            ],
+            options={
+                "verbose_name": "Значение фильтра",
+                "verbose_name_plural": "Список значений фильтров",
+            },
+        ),
+        migrations.AddIndex(
+            model_name="productparameter",
+            index=models.Index(
+                fields=["parameter", "value"], name="product_parameter_value_idx"
+            ),
+        ),
+        migrations.AddField(
+            model_name="parameterfacet",
+            name="category",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="parameter_facets",
+                to="backend.category",
+                verbose_name="Категория",
+            ),
+        ),
+        migrations.AddField(
+            model_name="parameterfacet",
+            name="parameter",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="facets",
+                to="backend.parameter",
+                verbose_name="Параметр",
+            ),
+        ),
+        migrations.AddField(
+            model_name="parameterfacet",
+            name="shop",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="parameter_facets",
+                to="backend.shop",
+                verbose_name="Магазин",
+            ),
+        ),
+    ]
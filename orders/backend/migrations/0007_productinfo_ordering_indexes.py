@@ -0,0 +1,37 @@
+# Generated by Django 4.2 on 2026-10-18 06:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("backend", "0006_parameterfacet"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="productinfo",
+            index=models.Index(fields=["price", "id"], name="product_info_price_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="productinfo",
+            index=models.Index(
+                fields=["quantity", "id"], name="product_info_quantity_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="productinfo",
+            index=models.Index(
+                fields=["shop", "price", "id"], name="product_info_shop_price_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="productinfo",
+            index=models.Index(
+                condition=models.Q(("quantity__gt", 0)),
+                fields=["price", "id"],
+                name="product_info_in_stock_idx",
+            ),
+        ),
+    ]
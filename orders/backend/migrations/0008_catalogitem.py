@@ -0,0 +1,224 @@
+# Generated by Django 4.2 on 2026-10-18 07:02
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations, models
+import django.db.models.deletion
+
+FILL_CATALOG = """
+INSERT INTO backend_catalogitem (
+    product_info_id, shop_id, shop_state, category_id, category_name,
+    product_name, model, quantity, price, price_rrc, parameters,
+    search_text, search_vector
+)
+SELECT info.id, info.shop_id, shop.state, product.category_id,
+       category.name, product.name, info.model, info.quantity, info.price,
+       info.price_rrc, coalesce(parameters.items, '[]'::jsonb),
+       product.name || ' ' || info.model || ' '
+           || coalesce(parameters.text, ''),
+       setweight(to_tsvector('russian', product.name), 'A')
+           || setweight(to_tsvector('russian', info.model), 'B')
+           || setweight(to_tsvector('russian',
+                                    coalesce(parameters.text, '')), 'C')
+FROM backend_productinfo AS info
+     JOIN backend_shop AS shop ON shop.id = info.shop_id
+     JOIN backend_product AS product ON product.id = info.product_id
+     JOIN backend_category AS category ON category.id = product.category_id
+     LEFT JOIN LATERAL (
+         SELECT jsonb_agg(jsonb_build_object('parameter', parameter.name,
+                                             'value', item.value)
+                          ORDER BY item.id) AS items,
+                string_agg(item.value, ' ') AS text
+         FROM backend_productparameter AS item
+              JOIN backend_parameter AS parameter
+                   ON parameter.id = item.parameter_id
+         WHERE item.product_info_id = info.id
+     ) AS parameters ON true
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("backend", "0007_productinfo_ordering_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CatalogItem",
+            fields=[
+                (
+                    "product_info",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="catalog_item",
+                        serialize=False,
+                        to="backend.productinfo",
+                        verbose_name="Информация о продукте",
+                    ),
+                ),
+                (
+                    "shop_state",
+                    models.BooleanField(verbose_name="Магазин принимает заказы"),
+                ),
+                (
+                    "category_name",
+                    models.CharField(max_length=40, verbose_name="Название категории"),
+                ),
+                (
+                    "product_name",
+                    models.CharField(max_length=80, verbose_name="Название продукта"),
+                ),
+                (
+                    "model",
+                    models.CharField(blank=True, max_length=80, verbose_name="Модель"),
+                ),
+                ("quantity", models.PositiveIntegerField(verbose_name="Количество")),
+                ("price", models.PositiveIntegerField(verbose_name="Цена")),
+                (
+                    "price_rrc",
+                    models.PositiveIntegerField(
+                        verbose_name="Рекомендуемая розничная цена"
+                    ),
+                ),
+                (
+                    "parameters",
+                    models.JSONField(default=list, verbose_name="Параметры"),
+                ),
+                (
+                    "search_text",
+                    models.TextField(blank=True, verbose_name="Текст для поиска"),
+                ),
+                (
+                    "search_vector",
+                    django.contrib.postgres.search.SearchVectorField(
+                        null=True, verbose_name="Поисковый вектор"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Запись каталога",
+                "verbose_name_plural": "Каталог",
+            },
+        ),
+        migrations.RemoveIndex(
+            model_name="productinfo",
+            name="product_info_search_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="productinfo",
+            name="product_info_search_trgm_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="productinfo",
+            name="product_info_price_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="productinfo",
+            name="product_info_quantity_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="productinfo",
+            name="product_info_shop_price_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="productinfo",
+            name="product_info_in_stock_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="productparameter",
+            name="product_parameter_value_idx",
+        ),
+        migrations.RemoveField(
+            model_name="productinfo",
+            name="search_text",
+        ),
+        migrations.RemoveField(
+            model_name="productinfo",
+            name="search_vector",
+        ),
+        migrations.AddField(
+            model_name="catalogitem",
+            name="category",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="catalog_items",
+                to="backend.category",
+                verbose_name="Категория",
+            ),
+        ),
+        migrations.AddField(
+            model_name="catalogitem",
+            name="shop",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="catalog_items",
+                to="backend.shop",
+                verbose_name="Магазин",
+            ),
+        ),
+        migrations.RunSQL(FILL_CATALOG, migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name="catalogitem",
+            index=models.Index(
+                fields=["price", "product_info"], name="catalog_item_price_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="catalogitem",
+            index=models.Index(
+                fields=["quantity", "product_info"], name="catalog_item_quantity_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="catalogitem",
+            index=models.Index(
+                fields=["product_name", "product_info"], name="catalog_item_name_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="catalogitem",
+            index=models.Index(
+                fields=["shop", "price", "product_info"],
+                name="catalog_item_shop_price_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="catalogitem",
+            index=models.Index(
+                fields=["category", "price", "product_info"],
+                name="catalog_item_category_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="catalogitem",
+            index=models.Index(
+                condition=models.Q(("quantity__gt", 0)),
+                fields=["price", "product_info"],
+                name="catalog_item_in_stock_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="catalogitem",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["parameters"],
+                name="catalog_item_params_idx",
+                opclasses=["jsonb_path_ops"],
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="catalogitem",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["search_vector"], name="catalog_item_search_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="catalogitem",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["search_text"],
+                name="catalog_item_trgm_idx",
+                opclasses=["gin_trgm_ops"],
+            ),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 4.2 on 2026-10-18 07:40
+
+import json
+
+from django.db import migrations, models
+
+
+def fill_fragments(apps, schema_editor):
+    """
+    Заполняем готовый JSON записей так же, как его выводит JSONRenderer
+    """
+    CatalogItem = apps.get_model("backend", "CatalogItem")
+    items = []
+    for item in CatalogItem.objects.order_by("pk").iterator(chunk_size=1000):
+        item.fragment = json.dumps(
+            {
+                "id": item.product_info_id,
+                "model": item.model,
+                "product": {"name": item.product_name,
+                            "category": item.category_name},
+                "shop": item.shop_id,
+                "quantity": item.quantity,
+                "price": item.price,
+                "price_rrc": item.price_rrc,
+                "product_parameters": [
+                    {"parameter": parameter["parameter"],
+                     "value": parameter["value"]}
+                    for parameter in item.parameters
+                ],
+            },
+            ensure_ascii=False,
+            allow_nan=False,
+            separators=(",", ":"),
+        ).replace("\u2028", "\\u2028").replace("\u2029", "\\u2029")
+        items.append(item)
+        if len(items) >= 1000:
+            CatalogItem.objects.bulk_update(items, ["fragment"])
+            items = []
+    CatalogItem.objects.bulk_update(items, ["fragment"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("backend", "0008_catalogitem"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="catalogitem",
+            name="fragment",
+            field=models.TextField(default="",
+                                   verbose_name="Готовый JSON записи"),
+        ),
+        migrations.RunPython(fill_fragments, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2 on 2026-10-18 08:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("backend", "0009_catalogitem_fragment"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="shop",
+            name="catalog_version",
+            field=models.PositiveIntegerField(
+                default=1, verbose_name="Версия каталога"
+            ),
+        ),
+        migrations.AddField(
+            model_name="user",
+            name="orders_version",
+            field=models.PositiveIntegerField(
+                default=1, verbose_name="Версия заказов"
+            ),
+        ),
+    ]
@@ -0,0 +1,91 @@
+# Generated by Django 4.2 on 2026-10-18 08:50
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("backend", "0010_shop_catalog_version_user_orders_version"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(
+                fields=["user", "-created_at"], name="order_user_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(
+                condition=models.Q(("state", "basket")),
+                fields=["user"],
+                name="order_basket_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(
+                fields=["-created_at"], name="order_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["category", "-name"], name="product_category_name_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="productinfo",
+            index=models.Index(
+                fields=["shop", "external_id"], name="product_info_shop_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="shop",
+            index=models.Index(
+                condition=models.Q(("state", True)),
+                fields=["-name"],
+                name="shop_active_name_idx",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="order",
+            name="user",
+            field=models.ForeignKey(
+                blank=True,
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="orders",
+                to=settings.AUTH_USER_MODEL,
+                verbose_name="Пользователь",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="product",
+            name="category",
+            field=models.ForeignKey(
+                blank=True,
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="products",
+                to="backend.category",
+                verbose_name="Категория",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="productinfo",
+            name="shop",
+            field=models.ForeignKey(
+                blank=True,
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="product_infos",
+                to="backend.shop",
+                verbose_name="Магазин",
+            ),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 4.2 on 2026-10-18 09:20
+
+from django.db import migrations, models
+
+FILL_PRICES = """
+UPDATE backend_orderitem AS item
+SET price = info.price
+FROM backend_productinfo AS info
+WHERE info.id = item.product_info_id
+"""
+
+FILL_TOTALS = """
+UPDATE backend_order AS "order"
+SET total_sum = totals.total_sum, item_count = totals.item_count
+FROM (
+    SELECT order_id, sum(quantity * price) AS total_sum,
+           count(*) AS item_count
+    FROM backend_orderitem
+    GROUP BY order_id
+) AS totals
+WHERE totals.order_id = "order".id
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("backend", "0011_hot_query_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="order",
+            name="item_count",
+            field=models.PositiveIntegerField(
+                default=0, verbose_name="Позиций"
+            ),
+        ),
+        migrations.AddField(
+            model_name="order",
+            name="total_sum",
+            field=models.PositiveIntegerField(default=0, verbose_name="Сумма"),
+        ),
+        migrations.AddField(
+            model_name="orderitem",
+            name="price",
+            field=models.PositiveIntegerField(
+                blank=True, default=0, verbose_name="Цена"
+            ),
+            preserve_default=False,
+        ),
+        migrations.RunSQL(FILL_PRICES, migrations.RunSQL.noop),
+        migrations.RunSQL(FILL_TOTALS, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 4.2 on 2026-10-18 09:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("backend", "0012_order_totals"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ImportItem",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("chunk", models.PositiveIntegerField(verbose_name="Часть")),
+                ("external_id", models.PositiveIntegerField(verbose_name="Внешний ИД")),
+                ("data", models.JSONField(verbose_name="Данные")),
+                (
+                    "job",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="items",
+                        to="backend.importjob",
+                        verbose_name="Импорт прайса",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Товар импорта",
+                "verbose_name_plural": "Список товаров импорта",
+            },
+        ),
+        migrations.AddIndex(
+            model_name="importitem",
+            index=models.Index(fields=["job", "chunk"], name="import_item_chunk_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="importitem",
+            index=models.Index(
+                fields=["job", "external_id"], name="import_item_external_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2 on 2026-10-18 10:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("backend", "0013_importitem"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="catalogitem",
+            name="category",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="catalog_items",
+                to="backend.category",
+                verbose_name="Категория",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="catalogitem",
+            name="shop",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="catalog_items",
+                to="backend.shop",
+                verbose_name="Магазин",
+            ),
+        ),
+    ]
@@ -1,6 +1,8 @@
 from django.contrib.auth.base_user import BaseUserManager
 from django.contrib.auth.models import AbstractUser
 from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 from django_rest_passwordreset.tokens import get_token_generator
@@ -15,6 +17,15 @@ STATE_CHOICES = (
     ("canceled", "Отменен"),
 )
 
+IMPORT_STATE_CHOICES = (
+    ("queued", "В очереди"),
+    ("running", "Выполняется"),
+    ("done", "Завершен"),
+    ("skipped", "Прайс не изменился"),
+    ("superseded", "Заменен более новым"),
+    ("failed", "Ошибка"),
+)
+
 USER_TYPE_CHOICES = (
     ("shop", "Магазин"),
     ("buyer", "Покупатель"),
@@ -97,6 +108,9 @@ class User(AbstractUser):
         max_length=5,
         default="buyer",
     )
+    orders_version = models.PositiveIntegerField(
+        verbose_name="Версия заказов", default=1
+    )
 
     def __str__(self):
         return f"{self.first_name} {self.last_name}"
@@ -123,11 +137,26 @@ class Shop(models.Model):
     )
     state = models.BooleanField(verbose_name="статус получения заказов",
                                 default=True)
+    feed_etag = models.CharField(verbose_name="ETag прайса", max_length=255,
+                                 blank=True)
+    feed_last_modified = models.CharField(
+        verbose_name="Last-Modified прайса", max_length=64, blank=True
+    )
+    feed_digest = models.CharField(verbose_name="Хеш прайса", max_length=64,
+                                   blank=True)
+    catalog_version = models.PositiveIntegerField(
+        verbose_name="Версия каталога", default=1
+    )
 
     class Meta:
         verbose_name = "Магазин"
         verbose_name_plural = "Список магазинов"
         ordering = ("-name",)
+        indexes = [
+            # список магазинов, принимающих заказы, в порядке Meta.ordering
+            models.Index(fields=["-name"], condition=models.Q(state=True),
+                         name="shop_active_name_idx"),
+        ]
 
     def __str__(self):
         return self.name
@@ -158,18 +187,24 @@ class Product(models.Model):
     """
 
     name = models.CharField(max_length=80, verbose_name="Название")
+    # одиночный индекс заменяет составной product_category_name_idx
     category = models.ForeignKey(
         Category,
         verbose_name="Категория",
         related_name="products",
         blank=True,
         on_delete=models.CASCADE,
+        db_index=False,
     )
 
     class Meta:
         verbose_name = "Продукт"
         verbose_name_plural = "Список продуктов"
         ordering = ("-name",)
+        indexes = [
+            models.Index(fields=["category", "-name"],
+                         name="product_category_name_idx"),
+        ]
 
     def __str__(self):
         return self.name
@@ -189,12 +224,14 @@ class ProductInfo(models.Model):
         blank=True,
         on_delete=models.CASCADE,
     )
+    # одиночный индекс заменяет составной product_info_shop_idx
     shop = models.ForeignKey(
         Shop,
         verbose_name="Магазин",
         related_name="product_infos",
         blank=True,
         on_delete=models.CASCADE,
+        db_index=False,
     )
     quantity = models.PositiveIntegerField(verbose_name="Количество")
     price = models.PositiveIntegerField(verbose_name="Цена")
@@ -210,6 +247,11 @@ class ProductInfo(models.Model):
                 name="unique_product_info"
             ),
         ]
+        indexes = [
+            # товары магазина и поиск по внешним ИД при импорте
+            models.Index(fields=["shop", "external_id"],
+                         name="product_info_shop_idx"),
+        ]
 
 
 class Parameter(models.Model):
@@ -260,6 +302,112 @@ class ProductParameter(models.Model):
         ]
 
 
+class ParameterFacet(models.Model):
+    """
+    Число товаров магазина в категории с данным значением параметра.
+    Пересчитывается при импорте прайса
+    """
+
+    shop = models.ForeignKey(
+        Shop,
+        verbose_name="Магазин",
+        related_name="parameter_facets",
+        on_delete=models.CASCADE,
+    )
+    category = models.ForeignKey(
+        Category,
+        verbose_name="Категория",
+        related_name="parameter_facets",
+        on_delete=models.CASCADE,
+    )
+    parameter = models.ForeignKey(
+        Parameter,
+        verbose_name="Параметр",
+        related_name="facets",
+        on_delete=models.CASCADE,
+    )
+    value = models.CharField(verbose_name="Значение", max_length=100)
+    count = models.PositiveIntegerField(verbose_name="Количество товаров")
+
+    class Meta:
+        verbose_name = "Значение фильтра"
+        verbose_name_plural = "Список значений фильтров"
+
+
+class CatalogItem(models.Model):
+    """
+    Плоская запись каталога для чтения: предложение магазина
+    с названиями продукта, категории и параметрами в JSON.
+    Пересчитывается при импорте и правке данных каталога
+    """
+
+    product_info = models.OneToOneField(
+        ProductInfo,
+        verbose_name="Информация о продукте",
+        related_name="catalog_item",
+        primary_key=True,
+        on_delete=models.CASCADE,
+    )
+    # одиночный индекс заменяет составной catalog_item_shop_price_idx
+    shop = models.ForeignKey(
+        Shop,
+        verbose_name="Магазин",
+        related_name="catalog_items",
+        on_delete=models.CASCADE,
+        db_index=False,
+    )
+    shop_state = models.BooleanField(verbose_name="Магазин принимает заказы")
+    # одиночный индекс заменяет составной catalog_item_category_idx
+    category = models.ForeignKey(
+        Category,
+        verbose_name="Категория",
+        related_name="catalog_items",
+        on_delete=models.CASCADE,
+        db_index=False,
+    )
+    category_name = models.CharField(max_length=40,
+                                     verbose_name="Название категории")
+    product_name = models.CharField(max_length=80,
+                                    verbose_name="Название продукта")
+    model = models.CharField(max_length=80, verbose_name="Модель", blank=True)
+    quantity = models.PositiveIntegerField(verbose_name="Количество")
+    price = models.PositiveIntegerField(verbose_name="Цена")
+    price_rrc = models.PositiveIntegerField(
+        verbose_name="Рекомендуемая розничная цена")
+    parameters = models.JSONField(verbose_name="Параметры", default=list)
+    fragment = models.TextField(verbose_name="Готовый JSON записи",
+                                default="")
+    search_text = models.TextField(verbose_name="Текст для поиска",
+                                   blank=True)
+    search_vector = SearchVectorField(verbose_name="Поисковый вектор",
+                                      null=True)
+
+    class Meta:
+        verbose_name = "Запись каталога"
+        verbose_name_plural = "Каталог"
+        indexes = [
+            models.Index(fields=["price", "product_info"],
+                         name="catalog_item_price_idx"),
+            models.Index(fields=["quantity", "product_info"],
+                         name="catalog_item_quantity_idx"),
+            models.Index(fields=["product_name", "product_info"],
+                         name="catalog_item_name_idx"),
+            models.Index(fields=["shop", "price", "product_info"],
+                         name="catalog_item_shop_price_idx"),
+            models.Index(fields=["category", "price", "product_info"],
+                         name="catalog_item_category_idx"),
+            models.Index(fields=["price", "product_info"],
+                         condition=models.Q(quantity__gt=0),
+                         name="catalog_item_in_stock_idx"),
+            GinIndex(fields=["parameters"], opclasses=["jsonb_path_ops"],
+                     name="catalog_item_params_idx"),
+            GinIndex(fields=["search_vector"],
+                     name="catalog_item_search_idx"),
+            GinIndex(fields=["search_text"], opclasses=["gin_trgm_ops"],
+                     name="catalog_item_trgm_idx"),
+        ]
+
+
 class Contact(models.Model):
     """
     Модель контактов пользователя
@@ -297,12 +445,15 @@ class Order(models.Model):
     Модель заказа
     """
 
+    # одиночный индекс заменяют составные order_user_created_idx
+    # и order_basket_idx
     user = models.ForeignKey(
         User,
         verbose_name="Пользователь",
         related_name="orders",
         blank=True,
         on_delete=models.CASCADE,
+        db_index=False,
     )
     created_at = models.DateTimeField(auto_now_add=True)
     state = models.CharField(
@@ -312,11 +463,27 @@ class Order(models.Model):
         Contact, verbose_name="Контакт", blank=True, null=True,
         on_delete=models.CASCADE
     )
+    # сумма и число позиций по зафиксированным ценам, их пересчитывает
+    # update_order_totals при каждом изменении позиций и цен корзины
+    total_sum = models.PositiveIntegerField(verbose_name="Сумма", default=0)
+    item_count = models.PositiveIntegerField(verbose_name="Позиций",
+                                             default=0)
 
     class Meta:
         verbose_name = "Заказ"
         verbose_name_plural = "Список заказов"
         ordering = ("-created_at",)
+        indexes = [
+            # заказы пользователя от новых к старым; условие
+            # state <> 'basket' проверяется по строкам индекса
+            models.Index(fields=["user", "-created_at"],
+                         name="order_user_created_idx"),
+            # у пользователя одна корзина среди многих заказов
+            models.Index(fields=["user"],
+                         condition=models.Q(state="basket"),
+                         name="order_basket_idx"),
+            models.Index(fields=["-created_at"], name="order_created_idx"),
+        ]
 
     def __str__(self):
         return str(self.created_at)
@@ -343,6 +510,9 @@ class OrderItem(models.Model):
         on_delete=models.CASCADE,
     )
     quantity = models.PositiveIntegerField(verbose_name="Количество")
+    # в корзине следует за ценой товара, при оформлении заказа
+    # фиксируется, и новый прайс ее больше не меняет
+    price = models.PositiveIntegerField(verbose_name="Цена", blank=True)
 
     class Meta:
         verbose_name = "Заказанная позиция"
@@ -353,6 +523,96 @@ class OrderItem(models.Model):
             ),
         ]
 
+    def save(self, *args, **kwargs):
+        if self.price is None:
+            self.price = self.product_info.price
+        return super().save(*args, **kwargs)
+
+
+class ImportJob(models.Model):
+    """
+    Модель задачи импорта прайса
+    """
+
+    user = models.ForeignKey(
+        User,
+        verbose_name="Пользователь",
+        related_name="import_jobs",
+        on_delete=models.CASCADE,
+    )
+    shop = models.ForeignKey(
+        Shop,
+        verbose_name="Магазин",
+        related_name="import_jobs",
+        blank=True,
+        null=True,
+        on_delete=models.SET_NULL,
+    )
+    url = models.URLField(verbose_name="Ссылка")
+    state = models.CharField(
+        verbose_name="Статус",
+        choices=IMPORT_STATE_CHOICES,
+        max_length=10,
+        default="queued",
+    )
+    error = models.TextField(verbose_name="Ошибка", blank=True)
+    goods_count = models.PositiveIntegerField(verbose_name="Товаров",
+                                              default=0)
+    created_count = models.PositiveIntegerField(verbose_name="Создано",
+                                                default=0)
+    updated_count = models.PositiveIntegerField(verbose_name="Обновлено",
+                                                default=0)
+    unchanged_count = models.PositiveIntegerField(verbose_name="Без изменений",
+                                                  default=0)
+    deleted_count = models.PositiveIntegerField(verbose_name="Удалено",
+                                                default=0)
+    fetch_time = models.FloatField(verbose_name="Загрузка, с", default=0)
+    parse_time = models.FloatField(verbose_name="Разбор, с", default=0)
+    diff_time = models.FloatField(verbose_name="Сравнение, с", default=0)
+    write_time = models.FloatField(verbose_name="Запись, с", default=0)
+    cleanup_time = models.FloatField(verbose_name="Очистка, с", default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        verbose_name = "Импорт прайса"
+        verbose_name_plural = "Список импортов прайсов"
+        ordering = ("-created_at",)
+
+    def __str__(self):
+        return f"{self.url} {self.state}"
+
+
+class ImportItem(models.Model):
+    """
+    Товар прайса, подготовленный к записи частью параллельного импорта
+    """
+
+    # одиночный индекс заменяют составные индексы ниже
+    job = models.ForeignKey(
+        ImportJob,
+        verbose_name="Импорт прайса",
+        related_name="items",
+        on_delete=models.CASCADE,
+        db_index=False,
+    )
+    chunk = models.PositiveIntegerField(verbose_name="Часть")
+    external_id = models.PositiveIntegerField(verbose_name="Внешний ИД")
+    data = models.JSONField(verbose_name="Данные")
+
+    class Meta:
+        verbose_name = "Товар импорта"
+        verbose_name_plural = "Список товаров импорта"
+        indexes = [
+            # часть читает свои товары, finalize ищет устаревшие
+            # товары магазина по внешнему ИД
+            models.Index(fields=["job", "chunk"],
+                         name="import_item_chunk_idx"),
+            models.Index(fields=["job", "external_id"],
+                         name="import_item_external_idx"),
+        ]
+
 
 class ConfirmEmailToken(models.Model):
     """
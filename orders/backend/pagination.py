@@ -0,0 +1,124 @@
+import json
+
+from django.conf import settings
+from django.db.models import F, Field, Func, Value
+from django.http import HttpResponse
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, _reverse_ordering
+from rest_framework.renderers import JSONRenderer
+
+# второй ключ делает порядок однозначным и совпадает с составными индексами:
+# курсор хранит значения обоих ключей и ищет следующую страницу по индексу.
+# Направление у ключей одно: строки сравниваются целиком
+CATALOG_ORDERINGS = {
+    "price": ("price", "pk"),
+    "-price": ("-price", "-pk"),
+    "name": ("product_name", "pk"),
+    "quantity": ("quantity", "pk"),
+}
+
+
+class ProductInfoPagination(CursorPagination):
+    """
+    Курсорная пагинация каталога по индексированному ключу
+    """
+
+    ordering = "pk"
+    page_size_query_param = "page_size"
+    max_page_size = settings.CATALOG_MAX_PAGE_SIZE
+
+    def get_ordering(self, request, queryset, view):
+        """
+        Сортируем по параметру ordering, результаты поиска без него
+        отдаем по убыванию релевантности
+        """
+        ordering = request.query_params.get("ordering")
+        if ordering in CATALOG_ORDERINGS:
+            return CATALOG_ORDERINGS[ordering]
+        if request.query_params.get("q", "").strip():
+            return ("-rank", "-pk")
+        return super().get_ordering(request, queryset, view)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """
+        Ищем страницу по всем ключам сортировки сразу:
+        (ключ, pk) > (значения из курсора) без OFFSET, так что
+        одинаковые значения первого ключа не мешают листать дальше
+        """
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        self.base_url = request.build_absolute_uri()
+        self.ordering = ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        reverse, position = False, None
+        if self.cursor is not None:
+            reverse, position = self.cursor.reverse, self.cursor.position
+
+        if reverse:
+            queryset = queryset.order_by(*_reverse_ordering(ordering))
+        else:
+            queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = self.seek(queryset, position,
+                                 ordering[0].startswith("-") != reverse)
+
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        following = None
+        if len(results) > len(self.page):
+            following = self._get_position_from_instance(results[-1],
+                                                         ordering)
+        if reverse:
+            self.page.reverse()
+            self.has_next = position is not None
+            self.has_previous = following is not None
+            self.next_position, self.previous_position = position, following
+        else:
+            self.has_next = following is not None
+            self.has_previous = position is not None
+            self.next_position, self.previous_position = following, position
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def seek(self, queryset, position, descending):
+        """
+        Оставляем записи после позиции курсора в порядке сортировки
+        """
+        try:
+            values = json.loads(position)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        key = Func(*(F(name.lstrip("-")) for name in self.ordering),
+                   function="ROW", output_field=Field())
+        bound = Func(*(Value(value) for value in values), function="ROW")
+        lookup = "cursor_key__lt" if descending else "cursor_key__gt"
+        return queryset.alias(cursor_key=key).filter(**{lookup: bound})
+
+    def _get_position_from_instance(self, instance, ordering):
+        if isinstance(instance, dict):
+            values = [instance[name.lstrip("-")] for name in ordering]
+        else:
+            values = [getattr(instance, name.lstrip("-"))
+                      for name in ordering]
+        return json.dumps(values)
+
+    def get_fragment_response(self, fragments, **extra):
+        """
+        Склеиваем готовые JSON-фрагменты записей в ответ того же вида,
+        что и get_paginated_response, не создавая сериализаторов
+        """
+        renderer = JSONRenderer()
+        parts = [
+            b'{"next":', renderer.render(self.get_next_link()) or b"null",
+            b',"previous":',
+            renderer.render(self.get_previous_link()) or b"null",
+            b',"results":[', ",".join(fragments).encode(), b"]",
+        ]
+        for key, value in extra.items():
+            parts += [b",", renderer.render(key), b":", renderer.render(value)]
+        parts.append(b"}")
+        return HttpResponse(b"".join(parts), content_type="application/json")
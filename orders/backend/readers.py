@@ -0,0 +1,186 @@
+from collections import defaultdict
+
+from rest_framework import serializers
+
+from .fieldsets import ORDER_EXPAND, ORDER_FIELDS, PRODUCT_INFO_FIELDS
+from .models import Contact, OrderItem, ProductInfo, ProductParameter
+
+# колонки записи каталога для каждого поля ответа
+CATALOG_COLUMNS = {
+    "id": ("pk",),
+    "model": ("model",),
+    "product": ("product_name", "category_name"),
+    "shop": ("shop_id",),
+    "quantity": ("quantity",),
+    "price": ("price",),
+    "price_rrc": ("price_rrc",),
+    "product_parameters": ("parameters",),
+}
+# ключи курсорной пагинации читаем при любом наборе полей
+CURSOR_COLUMNS = ("pk", "price", "quantity", "product_name")
+ORDER_COLUMNS = {"contact": "contact_id"}
+CONTACT_VALUES = ("id", "city", "street", "house", "structure", "building",
+                  "apartment", "phone")
+
+# тот же формат даты, что у OrderSerializer
+format_datetime = serializers.DateTimeField().to_representation
+
+
+def catalog_columns(fields=PRODUCT_INFO_FIELDS):
+    """
+    Колонки записей каталога, нужные для выбранных полей
+    """
+    columns = list(CURSOR_COLUMNS)
+    for field in fields:
+        columns += CATALOG_COLUMNS[field]
+    return tuple(dict.fromkeys(columns))
+
+
+def catalog_item_data(row, fields=PRODUCT_INFO_FIELDS):
+    """
+    Запись каталога из values() в формате ProductInfoSerializer
+    """
+    data = {}
+    for field in fields:
+        if field == "product":
+            data[field] = {"name": row["product_name"],
+                           "category": row["category_name"]}
+        elif field == "product_parameters":
+            data[field] = [
+                {"parameter": item["parameter"], "value": item["value"]}
+                for item in row["parameters"]
+            ]
+        else:
+            data[field] = row[CATALOG_COLUMNS[field][0]]
+    return data
+
+
+def product_info_data(ids, with_parameters=True):
+    """
+    Словарь id -> товар в формате ProductInfoSerializer
+    за два запроса values_list()
+    """
+    parameters = defaultdict(list)
+    if with_parameters:
+        rows = (
+            ProductParameter.objects.filter(product_info_id__in=ids)
+            .order_by("id")
+            .values_list("product_info_id", "parameter__name", "value")
+        )
+        for product_info_id, name, value in rows:
+            parameters[product_info_id].append({"parameter": name,
+                                                "value": value})
+    rows = ProductInfo.objects.filter(id__in=ids).values_list(
+        "id", "model", "product__name", "product__category__name",
+        "shop_id", "quantity", "price", "price_rrc",
+    )
+    product_infos = {}
+    for (product_info_id, model, name, category, shop_id, quantity,
+         price, price_rrc) in rows:
+        product_infos[product_info_id] = {
+            "id": product_info_id,
+            "model": model,
+            "product": {"name": name, "category": category},
+            "shop": shop_id,
+            "quantity": quantity,
+            "price": price,
+            "price_rrc": price_rrc,
+        }
+        if with_parameters:
+            product_infos[product_info_id]["product_parameters"] = (
+                parameters[product_info_id]
+            )
+    return product_infos
+
+
+def order_columns(fields=ORDER_FIELDS, columns=None):
+    """
+    Колонки заказа, нужные для выбранных полей. columns подменяет
+    колонки полей, например аннотациями
+    """
+    columns = {**ORDER_COLUMNS, **(columns or {})}
+    columns = [columns.get(field, field) for field in fields
+               if field != "ordered_items"]
+    return tuple(dict.fromkeys(["id", *columns]))
+
+
+def order_rows_data(rows, fields=ORDER_FIELDS, expand=ORDER_EXPAND,
+                    columns=None):
+    """
+    Заказы в формате OrderSerializer из строк values(). Позиции,
+    товары и контакты читаем только для раскрытых связей
+    """
+    ordered_items = defaultdict(list)
+    if "ordered_items" in fields and "ordered_items" in expand:
+        items = list(
+            OrderItem.objects.filter(order_id__in=[row["id"] for row in rows])
+            .order_by("id")
+            .values_list("order_id", "id", "product_info_id", "quantity",
+                         "price")
+        )
+        product_infos = {}
+        if "product_info" in expand:
+            product_infos = product_info_data(
+                {item[2] for item in items},
+                with_parameters="product_parameters" in expand,
+            )
+        for order_id, item_id, product_info_id, quantity, price in items:
+            ordered_items[order_id].append({
+                "id": item_id,
+                "product_info": product_infos.get(product_info_id,
+                                                  product_info_id),
+                "quantity": quantity,
+                "price": price,
+            })
+
+    contacts = {}
+    if "contact" in fields and "contact" in expand:
+        contacts = {
+            contact["id"]: contact
+            for contact in Contact.objects.filter(
+                id__in={row["contact_id"] for row in rows} - {None}
+            ).values(*CONTACT_VALUES)
+        }
+
+    result = []
+    for row in rows:
+        data = {}
+        for field in fields:
+            if field == "ordered_items":
+                if "ordered_items" in expand:
+                    data[field] = ordered_items[row["id"]]
+            elif field == "created_at":
+                data[field] = format_datetime(row["created_at"])
+            elif field == "contact":
+                data[field] = contacts.get(row["contact_id"],
+                                           row["contact_id"])
+            else:
+                data[field] = row[(columns or {}).get(field, field)]
+        result.append(data)
+    return result
+
+
+def order_data(orders, fields=ORDER_FIELDS, expand=ORDER_EXPAND,
+               columns=None):
+    """
+    Список заказов в формате OrderSerializer
+    """
+    rows = list(orders.values(*order_columns(fields, columns)))
+    return order_rows_data(rows, fields, expand, columns)
+
+
+def iter_order_data(orders, fields=ORDER_FIELDS, expand=ORDER_EXPAND,
+                    chunk_size=1000, columns=None):
+    """
+    Заказы по одному, читая их курсором частями по chunk_size:
+    в памяти держим только текущую часть
+    """
+    chunk = []
+    for row in orders.values(*order_columns(fields, columns)).iterator(
+            chunk_size=chunk_size):
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield from order_rows_data(chunk, fields, expand, columns)
+            chunk = []
+    if chunk:
+        yield from order_rows_data(chunk, fields, expand, columns)
@@ -0,0 +1,68 @@
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+    TrigramWordSimilarity,
+)
+from django.db.models import (
+    CharField,
+    F,
+    IntegerField,
+    OuterRef,
+    Q,
+    Subquery,
+    TextField,
+    Value,
+)
+from django.db.models.functions import Cast, Coalesce, Concat
+
+from .models import ProductParameter
+
+SEARCH_CONFIG = "russian"
+# ранг приводим к целому, чтобы курсор пагинации сравнивал его точно
+RANK_SCALE = 1000
+
+
+def refresh_search_index(catalog_items):
+    """
+    Пересчитываем поисковый текст и вектор записей каталога одним
+    запросом: название продукта, модель и значения параметров
+    """
+    parameters = Coalesce(
+        Subquery(
+            ProductParameter.objects.filter(product_info_id=OuterRef("pk"))
+            .order_by()
+            .values("product_info_id")
+            .annotate(values=StringAgg("value", " "))
+            .values("values"),
+            output_field=CharField(),
+        ),
+        Value(""),
+    )
+    return catalog_items.update(
+        search_text=Concat("product_name", Value(" "), "model", Value(" "),
+                           parameters, output_field=TextField()),
+        search_vector=(
+            SearchVector("product_name", weight="A", config=SEARCH_CONFIG)
+            + SearchVector("model", weight="B", config=SEARCH_CONFIG)
+            + SearchVector(parameters, weight="C", config=SEARCH_CONFIG)
+        ),
+    )
+
+
+def search_products(queryset, text):
+    """
+    Отбираем товары по полнотекстовому запросу или похожести триграмм,
+    чтобы находить и слова с опечатками, и ранжируем результат
+    """
+    query = SearchQuery(text, config=SEARCH_CONFIG, search_type="websearch")
+    rank = (
+        SearchRank(F("search_vector"), query)
+        + TrigramWordSimilarity(text, "search_text")
+    )
+    return queryset.filter(
+        Q(search_vector=query) | Q(search_text__trigram_word_similar=text)
+    ).annotate(
+        rank=Cast(rank * RANK_SCALE, output_field=IntegerField())
+    )
@@ -1,6 +1,8 @@
 from rest_framework import serializers
 from .models import (
+    CatalogItem,
     Contact,
+    ImportJob,
     User,
     Category,
     Shop,
@@ -12,6 +14,41 @@ from .models import (
 )
 
 
+class SparseFieldsMixin:
+    """
+    Оставляем поля из context["fields"] и раскрываем только связи
+    из context["expand"]. Без этих ключей выводим все поля
+    """
+
+    # связи, которые раскрываются через expand: без раскрытия вместо
+    # вложенного объекта выводим его id (True) или убираем поле (False)
+    expandable_fields = {}
+
+    def get_fields(self):
+        fields = super().get_fields()
+        parent = self.parent
+        if "fields" in self.context and (
+            parent is None
+            or (parent.parent is None
+                and isinstance(parent, serializers.ListSerializer))
+        ):
+            fields = {name: field for name, field in fields.items()
+                      if name in self.context["fields"]}
+        expand = self.context.get("expand")
+        if expand is None:
+            return fields
+        for name, keep_id in self.expandable_fields.items():
+            if name not in fields or name in expand:
+                continue
+            if keep_id:
+                fields[name] = serializers.PrimaryKeyRelatedField(
+                    read_only=True
+                )
+            else:
+                del fields[name]
+        return fields
+
+
 class ContactSerializer(serializers.ModelSerializer):
     """
     Сериализуем контакты
@@ -95,11 +132,13 @@ class ProductParameterSerializer(serializers.ModelSerializer):
         fields = ("parameter", "value")
 
 
-class ProductInfoSerializer(serializers.ModelSerializer):
+class ProductInfoSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """
     Сериализуем информацию о продуктах
     """
 
+    expandable_fields = {"product_parameters": False}
+
     product = ProductSerializer(read_only=True)
     product_parameters = ProductParameterSerializer(read_only=True, many=True)
 
@@ -118,6 +157,33 @@ class ProductInfoSerializer(serializers.ModelSerializer):
         read_only_fields = ("id",)
 
 
+class CatalogItemSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """
+    Сериализуем записи каталога в том же виде, что ProductInfoSerializer
+    """
+
+    expandable_fields = ProductInfoSerializer.expandable_fields
+
+    id = serializers.IntegerField(source="product_info_id", read_only=True)
+    product = serializers.SerializerMethodField()
+    shop = serializers.IntegerField(source="shop_id", read_only=True)
+    product_parameters = serializers.SerializerMethodField()
+
+    class Meta:
+        model = CatalogItem
+        fields = ProductInfoSerializer.Meta.fields
+
+    def get_product(self, obj):
+        return {"name": obj.product_name, "category": obj.category_name}
+
+    def get_product_parameters(self, obj):
+        # jsonb хранит ключи объектов в своем порядке
+        return [
+            {"parameter": item["parameter"], "value": item["value"]}
+            for item in obj.parameters
+        ]
+
+
 class OrderItemSerializer(serializers.ModelSerializer):
     """
     Сериализуем товары в заказе
@@ -126,28 +192,71 @@ class OrderItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = OrderItem
         fields = "__all__"
-        read_only_fields = ("id",)
+        read_only_fields = ("id", "price")
         extra_kwargs = {"order": {"write_only": True}}
 
 
-class OrderItemCreateSerializer(OrderItemSerializer):
+class BasketItemSerializer(serializers.Serializer):
+    """
+    Проверяем позицию для добавления в корзину без запроса товара:
+    товары всей корзины проверяются одним запросом
+    """
+
+    product_info = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(min_value=1)
+
+
+class OrderItemCreateSerializer(SparseFieldsMixin, OrderItemSerializer):
     """
     Сериализуем создание продуктов в заказе
     """
 
+    expandable_fields = {"product_info": True}
+
     product_info = ProductInfoSerializer(read_only=True)
 
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """
     Сериализуем заказ
     """
 
+    expandable_fields = {"ordered_items": False, "contact": True}
+
     ordered_items = OrderItemCreateSerializer(read_only=True, many=True)
-    total_sum = serializers.IntegerField()
     contact = ContactSerializer(read_only=True)
 
     class Meta:
         model = Order
         fields = ("id", "ordered_items", "state", "created_at",
-                  "total_sum", "contact")
+                  "total_sum", "item_count", "contact")
+        read_only_fields = ("total_sum", "item_count")
+
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    """
+    Сериализуем задачи импорта прайса
+    """
+
+    class Meta:
+        model = ImportJob
+        fields = (
+            "id",
+            "url",
+            "shop",
+            "state",
+            "error",
+            "goods_count",
+            "created_count",
+            "updated_count",
+            "unchanged_count",
+            "deleted_count",
+            "fetch_time",
+            "parse_time",
+            "diff_time",
+            "write_time",
+            "cleanup_time",
+            "created_at",
+            "finished_at",
+        )
+        read_only_fields = fields
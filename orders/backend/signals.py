@@ -0,0 +1,212 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+)
+from django.dispatch import receiver
+
+from .cache import bump_catalog_version
+from .importer import deleted_by_import, rebuild_facets, refresh_catalog
+from .models import (
+    CatalogItem,
+    Category,
+    Contact,
+    Order,
+    OrderItem,
+    Parameter,
+    Product,
+    ProductInfo,
+    ProductParameter,
+    Shop,
+)
+from .totals import refresh_basket_prices, update_order_totals
+from .versions import bump_catalog_versions, bump_orders_version
+
+CATALOG_MODELS = (Shop, Category, Product, ProductInfo, Parameter,
+                  ProductParameter)
+ORDER_MODELS = (Order, OrderItem, Contact)
+
+
+def deleted_by_cascade(sender, origin):
+    """
+    Запись удалена вместе с родителем, версию увеличит его обработчик
+    """
+    if origin is None:
+        return False
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return model is not sender
+
+
+def catalog_shop_ids(sender, instance):
+    """
+    Магазины, каталог которых затрагивает запись; None означает все
+    """
+    if sender is Shop:
+        return [instance.id]
+    if sender is ProductInfo:
+        return [instance.shop_id]
+    if sender is Product:
+        return ProductInfo.objects.filter(
+            product_id=instance.id).values("shop_id")
+    if sender is ProductParameter:
+        return ProductInfo.objects.filter(
+            id=instance.product_info_id).values("shop_id")
+    return None
+
+
+def catalog_changed(sender, instance, origin=None, **kwargs):
+    """
+    Увеличиваем версии каталога магазинов и сбрасываем кеш каталога
+    при изменении его данных, например из админки
+    """
+    # импорт сам увеличивает версию магазина, а здесь это был бы
+    # запрос на каждую удаленную строку
+    if deleted_by_import():
+        return
+    # параметры удаляются каскадом вместе с товаром, версию магазина
+    # тогда увеличивает обработчик товара
+    if not (sender is ProductParameter
+            and deleted_by_cascade(sender, origin)):
+        bump_catalog_versions(catalog_shop_ids(sender, instance))
+    transaction.on_commit(bump_catalog_version)
+
+
+def orders_changed(sender, instance, origin=None, **kwargs):
+    """
+    Увеличиваем версию заказов владельца заказа, позиции или контакта
+    """
+    if deleted_by_cascade(sender, origin):
+        return
+    if sender is OrderItem:
+        user_ids = Order.objects.filter(
+            id=instance.order_id).values("user_id")
+    else:
+        user_ids = [instance.user_id]
+    bump_orders_version(user_ids)
+
+
+# подключаем к конкретным моделям: обработчик без sender отключает
+# быстрое удаление queryset.delete() для всех моделей проекта
+for model in CATALOG_MODELS:
+    post_save.connect(catalog_changed, sender=model)
+    post_delete.connect(catalog_changed, sender=model)
+for model in ORDER_MODELS:
+    post_save.connect(orders_changed, sender=model)
+    post_delete.connect(orders_changed, sender=model)
+
+
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+def order_items_changed(sender, instance, origin=None, **kwargs):
+    """
+    Пересчитываем сохраненные сумму и число позиций заказа.
+    Массовые изменения позиций пересчитывают их сами
+    """
+    # вместе с заказом пересчитывать нечего, а позиции удаленного
+    # товара меняют и состав заказа
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if model is not Order:
+        update_order_totals([instance.order_id])
+
+
+@receiver(post_save, sender=ProductInfo)
+def basket_prices_changed(sender, instance, **kwargs):
+    """
+    Переносим цену товара, измененную из админки, в открытые корзины
+    """
+    refresh_basket_prices([instance.id])
+
+
+@receiver(m2m_changed, sender=Category.shops.through)
+def category_shops_changed(sender, instance, action, pk_set, **kwargs):
+    if action.startswith("post_"):
+        if isinstance(instance, Shop):
+            bump_catalog_versions([instance.id])
+        else:
+            # после clear магазины категории уже неизвестны
+            bump_catalog_versions(pk_set or None)
+    transaction.on_commit(bump_catalog_version)
+
+
+@receiver(post_save, sender=Shop)
+def catalog_shop_changed(sender, instance, **kwargs):
+    """
+    Переносим в каталог состояние магазина: остальные данные магазина
+    в записи каталога не хранятся
+    """
+    CatalogItem.objects.filter(shop_id=instance.id).update(
+        shop_state=instance.state)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=ProductInfo)
+@receiver(post_save, sender=Parameter)
+@receiver(post_save, sender=ProductParameter)
+@receiver(post_delete, sender=ProductParameter)
+def catalog_item_changed(sender, instance, origin=None, **kwargs):
+    """
+    Пересчитываем записи каталога после правки из админки.
+    Импорт пишет пачками без сигналов и пересчитывает их сам
+    """
+    # вместе с товаром запись каталога удаляется каскадом, а вместе
+    # с именем параметра записи пересчитывает parameter_deleted
+    if deleted_by_import() or deleted_by_cascade(sender, origin):
+        return
+    if sender is Category:
+        product_infos = ProductInfo.objects.filter(
+            product__category_id=instance.id)
+    elif sender is Product:
+        product_infos = ProductInfo.objects.filter(product_id=instance.id)
+    elif sender is ProductInfo:
+        product_infos = ProductInfo.objects.filter(id=instance.id)
+    elif sender is Parameter:
+        product_infos = ProductInfo.objects.filter(
+            product_parameters__parameter_id=instance.id)
+    else:
+        product_infos = ProductInfo.objects.filter(
+            id=instance.product_info_id)
+    refresh_catalog(product_infos)
+
+
+@receiver(pre_delete, sender=Parameter)
+@receiver(post_delete, sender=Parameter)
+def parameter_deleted(sender, instance, signal, **kwargs):
+    """
+    Пересчитываем записи каталога товаров с удаленным параметром
+    одним проходом, а не по строке на каждое значение параметра
+    """
+    if signal is pre_delete:
+        instance.catalog_product_info_ids = list(
+            ProductInfo.objects.filter(
+                product_parameters__parameter_id=instance.id
+            ).values_list("id", flat=True)
+        )
+    else:
+        refresh_catalog(ProductInfo.objects.filter(
+            id__in=instance.catalog_product_info_ids))
+
+
+@receiver(post_save, sender=ProductInfo)
+@receiver(post_save, sender=ProductParameter)
+@receiver(post_delete, sender=ProductInfo)
+@receiver(post_delete, sender=ProductParameter)
+def facet_data_changed(sender, instance, origin=None, **kwargs):
+    """
+    Пересчитываем значения фильтров магазина после правки из админки
+    """
+    # вместе с товаром фильтры пересчитывает обработчик товара, а
+    # строки фильтров удаленного параметра удаляются каскадом
+    if deleted_by_import() or (sender is ProductParameter
+                               and deleted_by_cascade(sender, origin)):
+        return
+    if sender is ProductInfo:
+        shop_id = instance.shop_id
+    else:
+        shop_id = instance.product_info.shop_id
+    transaction.on_commit(partial(rebuild_facets, shop_id))
@@ -0,0 +1,46 @@
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import JSONRenderer
+
+# примерный размер части ответа, которую отдаем серверу за раз
+STREAM_BUFFER_SIZE = 64 * 1024
+
+
+def stream_requested(request):
+    """
+    Клиент просит выгрузку целиком потоком: ?stream=1
+    """
+    return (request.query_params.get("stream") in ("1", "true")
+            and request.accepted_renderer.format == "json")
+
+
+def iter_json_list(items):
+    """
+    Рендерим JSON-массив по элементам так же, как JSONRenderer рендерит
+    список целиком. Элемент — готовый JSON-фрагмент строкой или данные
+    """
+    renderer = JSONRenderer()
+    buffer = [b"["]
+    size = 1
+    for index, item in enumerate(items):
+        if isinstance(item, str):
+            item = item.encode()
+        else:
+            item = renderer.render(item)
+        if index:
+            buffer.append(b",")
+        buffer.append(item)
+        size += len(item) + 1
+        if size >= STREAM_BUFFER_SIZE:
+            yield b"".join(buffer)
+            buffer, size = [], 0
+    buffer.append(b"]")
+    yield b"".join(buffer)
+
+
+def streaming_json_response(items):
+    """
+    Отдаем JSON-массив потоком: элементы читаются и рендерятся
+    по мере отправки, ответ не собирается в памяти целиком
+    """
+    return StreamingHttpResponse(iter_json_list(items),
+                                 content_type="application/json")
@@ -1,23 +1,25 @@
-import os
+from collections import defaultdict
 
-from celery import shared_task
+from celery import chord, shared_task
 from django.conf import settings
 from django.core.mail import EmailMultiAlternatives
 from django.core.validators import URLValidator
 from django.core.exceptions import ValidationError
-from django.http import JsonResponse
-from yaml import load as load_yaml, SafeLoader
-
-from .models import (
-    ConfirmEmailToken,
-    User,
-    Category,
-    ProductInfo,
-    Product,
-    Parameter,
-    ProductParameter,
-    Shop,
+from django.utils import timezone
+from requests import RequestException
+from yaml import YAMLError
+
+from .feed import FeedError, fetch_feed, iter_feed, open_feed
+from .importer import (
+    claim_job,
+    finalize_import,
+    measure,
+    next_job,
+    prepare_import,
+    record_progress,
+    write_chunk,
 )
+from .models import ConfirmEmailToken, ImportItem, ImportJob, Shop, User
 
 
 @shared_task()
@@ -90,52 +92,128 @@ def new_order(user_id, **kwargs):
 
 
 @shared_task()
-def do_import(url, user_id):
+def import_chunk(shop_id, job_id, chunk):
+    """
+    Записываем часть прайса от партнера. Ошибку обрабатывает
+    import_failed, когда завершится вся группа частей
+    """
+    return write_chunk(shop_id, job_id, chunk)
+
+
+@shared_task()
+def finish_import(results, shop_id, job_id, feed_state=None):
+    """
+    Завершаем импорт прайса: удаляем товары, которых нет в прайсе
+    """
+    summary = finalize_import(results, shop_id, job_id, feed_state)
+    start_next_import(job_id)
+    return summary
+
+
+@shared_task()
+def import_failed(request, exc, traceback, job_id=None):
+    """
+    Обработчик ошибки chord: вызывается, когда все части завершились
+    и хотя бы одна упала, или когда упал finish_import
+    """
+    fail_job(job_id, exc)
+
+
+def fail_job(job_id, error):
+    """
+    Отмечаем задачу импорта как завершенную с ошибкой
+    и удаляем подготовленные ею товары
+    """
+    ImportJob.objects.filter(id=job_id).update(
+        state="failed", error=str(error), finished_at=timezone.now()
+    )
+    ImportItem.objects.filter(job_id=job_id).delete()
+    start_next_import(job_id)
+
+
+def start_next_import(job_id):
+    """
+    Запускаем самый старый ожидающий импорт того же магазина после
+    завершения задачи. Если его заменила более новая задача, он
+    запустит следующий, пока очередь не дойдет до самой новой
+    """
+    job = ImportJob.objects.filter(id=job_id).first()
+    queued = job and next_job(job.user_id)
+    if queued:
+        do_import.delay(queued.url, queued.user_id, queued.id)
+
+
+@shared_task()
+def do_import(url, user_id, job_id=None):
     """
     Обновляем прайс от партнера
     """
+    if job_id is None:
+        job_id = ImportJob.objects.create(user_id=user_id, url=url).id
+    # выполняем только задачу, которую этот вызов перевел из очереди
+    state = claim_job(job_id, user_id)
+    if state == "superseded":
+        start_next_import(job_id)
+    if state != "running":
+        return {"Status": True, "Job": job_id, "State": state}
     if url:
         validate_url = URLValidator()
         try:
             validate_url(url)
         except ValidationError as e:
-            return JsonResponse({"Status": False, "Error": str(e)})
+            fail_job(job_id, e)
+            return {"Status": False, "Error": str(e), "Job": job_id}
         else:
-            stream = os.path.join(os.getcwd(), "data/shop1.yaml")
-
-            with open(stream, encoding="utf-8") as file:
-                data = load_yaml(file, Loader=SafeLoader)
-                shop, _ = Shop.objects.get_or_create(name=data["shop"],
-                                                     user_id=user_id)
-                for category in data["categories"]:
-                    category_object, _ = Category.objects.get_or_create(
-                        id=category["id"], name=category["name"]
-                    )
-                    category_object.shops.add(shop.id)
-                    category_object.save()
-                ProductInfo.objects.filter(shop_id=shop.id).delete()
-                for item in data["goods"]:
-                    product, _ = Product.objects.get_or_create(
-                        name=item["name"], category_id=item["category"]
-                    )
-
-                    product_info = ProductInfo.objects.create(
-                        product_id=product.id,
-                        external_id=item["id"],
-                        model=item["model"],
-                        price=item["price"],
-                        price_rrc=item["price_rrc"],
-                        quantity=item["quantity"],
-                        shop_id=shop.id,
-                    )
-                    for name, value in item["parameters"].items():
-                        parameter_object, _ = Parameter.objects.get_or_create(
-                            name=name)
-                        ProductParameter.objects.create(
-                            product_info_id=product_info.id,
-                            parameter_id=parameter_object.id,
-                            value=value,
-                        )
-
-                return JsonResponse({"Status": True})
-    return {"Status": False, "Errors": "Url is false"}
+            try:
+                return run_import(url, user_id, job_id)
+            except (RequestException, FeedError, YAMLError) as e:
+                fail_job(job_id, e)
+                return {"Status": False, "Error": str(e), "Job": job_id}
+            except Exception as e:
+                fail_job(job_id, e)
+                raise
+    fail_job(job_id, "Url is false")
+    return {"Status": False, "Errors": "Url is false", "Job": job_id}
+
+
+def run_import(url, user_id, job_id):
+    """
+    Скачиваем и разбираем прайс, затем запускаем запись частями
+    """
+    timings = defaultdict(float)
+    shop = Shop.objects.filter(user_id=user_id).first()
+    with measure(timings, "fetch_time"):
+        download = fetch_feed(
+            url,
+            etag=shop.feed_etag if shop else "",
+            last_modified=shop.feed_last_modified if shop else "",
+        )
+    if download is None or (shop and shop.feed_digest == download.digest):
+        if download is not None:
+            download.file.close()
+        record_progress(job_id, timings=timings, shop=shop, state="skipped",
+                        finished_at=timezone.now())
+        start_next_import(job_id)
+        return {"Status": True, "Changed": False, "Job": job_id}
+
+    with download.file as file:
+        prepared = prepare_import(iter_feed(open_feed(file)), user_id,
+                                  job_id, settings.IMPORT_CHUNK_SIZE,
+                                  timings)
+    feed_state = {
+        "feed_etag": download.etag,
+        "feed_last_modified": download.last_modified,
+        "feed_digest": download.digest,
+    }
+
+    shop_id = prepared["shop_id"]
+    record_progress(job_id, timings=timings, shop_id=shop_id)
+    # части читают свои товары из ImportItem: в брокер уходят
+    # только номера частей
+    callback = finish_import.s(shop_id, job_id, feed_state)
+    chord(
+        import_chunk.s(shop_id, job_id, chunk)
+        for chunk in range(prepared["chunks"])
+    )(callback.on_error(import_failed.s(job_id=job_id)))
+
+    return {"Status": True, "Job": job_id}
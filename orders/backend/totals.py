@@ -0,0 +1,68 @@
+from django.db.models import Count, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import Order, OrderItem, ProductInfo
+
+
+def update_order_totals(order_ids):
+    """
+    Пересчитываем сохраненные сумму и число позиций заказов
+    одним UPDATE по зафиксированным ценам позиций
+    """
+    items = OrderItem.objects.filter(order=OuterRef("pk")).values("order")
+    Order.objects.filter(id__in=order_ids).update(
+        total_sum=Coalesce(
+            Subquery(items.annotate(
+                total=Sum(F("quantity") * F("price"))).values("total")),
+            Value(0),
+        ),
+        item_count=Coalesce(
+            Subquery(items.annotate(count=Count("id")).values("count")),
+            Value(0),
+        ),
+    )
+
+
+def partner_order_totals(user_id):
+    """
+    Сумма и число позиций поставщика в заказе коррелированными
+    подзапросами по зафиксированным ценам: заказ не соединяется
+    с позициями, и строки заказов не размножаются
+    """
+    items = (
+        OrderItem.objects.filter(order=OuterRef("pk"),
+                                 product_info__shop__user_id=user_id)
+        .order_by()
+        .values("order")
+    )
+    return {
+        "partner_total_sum": Subquery(items.annotate(
+            total=Sum(F("quantity") * F("price"))).values("total")),
+        "partner_item_count": Subquery(items.annotate(
+            count=Count("id")).values("count")),
+    }
+
+
+def freeze_prices(items):
+    """
+    Фиксируем в позициях текущие цены товаров
+    """
+    items.update(price=Subquery(
+        ProductInfo.objects.filter(id=OuterRef("product_info_id"))
+        .values("price")
+    ))
+
+
+def refresh_basket_prices(product_info_ids):
+    """
+    Переносим новые цены товаров в открытые корзины и пересчитываем
+    их суммы: цена позиции фиксируется только при оформлении заказа
+    """
+    items = OrderItem.objects.filter(
+        order__state="basket", product_info_id__in=product_info_ids
+    ).exclude(price=F("product_info__price"))
+    order_ids = list(items.values_list("order_id", flat=True).distinct())
+    if order_ids:
+        freeze_prices(OrderItem.objects.filter(
+            order_id__in=order_ids, product_info_id__in=product_info_ids))
+        update_order_totals(order_ids)
@@ -3,6 +3,7 @@ from .views import (
     CategoryView,
     PartnerState,
     PartnerUpdate,
+    PartnerImportJob,
     PartnerOrders,
     RegisterAccount,
     ConfirmAccount,
@@ -31,6 +32,10 @@ r.register("partner/state", PartnerState, basename="partner-state",)
 
 urlpatterns = [
     path("partner/update", PartnerUpdate.as_view(), name="partner-update"),
+    path(
+        "partner/update/<int:pk>", PartnerImportJob.as_view(),
+        name="partner-update-job"
+    ),
     path("partner/orders", PartnerOrders.as_view(), name="partner-orders"),
     path("user/register", RegisterAccount.as_view(), name="user-register"),
     path(
@@ -0,0 +1,66 @@
+from django.contrib.postgres.aggregates import StringAgg
+from django.db.models import F, TextField, Value
+from django.db.models.functions import MD5, Coalesce, Concat
+
+from .models import Shop, User
+
+
+def bump_catalog_versions(shop_ids=None):
+    """
+    Увеличиваем версии каталога магазинов, по умолчанию всех.
+    Вызываем в той же транзакции, что и изменение данных
+    """
+    shops = Shop.objects.all()
+    if shop_ids is not None:
+        shops = shops.filter(id__in=shop_ids)
+    shops.update(catalog_version=F("catalog_version") + 1)
+
+
+def bump_orders_version(user_ids):
+    """
+    Увеличиваем версии заказов пользователей
+    """
+    User.objects.filter(id__in=user_ids).update(
+        orders_version=F("orders_version") + 1
+    )
+
+
+def catalog_digest(shop_id=None):
+    """
+    Хеш версий каталога магазинов одним запросом
+    """
+    shops = Shop.objects.all()
+    if shop_id:
+        shops = shops.filter(id=shop_id)
+    return shops.aggregate(digest=MD5(Coalesce(
+        StringAgg(
+            Concat("id", Value(":"), "catalog_version",
+                   output_field=TextField()),
+            ",",
+            ordering="id",
+        ),
+        Value(""),
+        output_field=TextField(),
+    )))["digest"]
+
+
+def catalog_etag(request, *args, **kwargs):
+    """
+    ETag каталога: версии магазинов и формат ответа.
+    Фильтр по магазину сужает его до версии этого магазина
+    """
+    shop_id = request.query_params.get("shop_id", "")
+    digest = catalog_digest(shop_id if shop_id.isdigit() else None)
+    return f"{digest}-{request.accepted_renderer.format}"
+
+
+def orders_etag(request, *args, **kwargs):
+    """
+    ETag заказов: версия заказов пользователя и версии каталога,
+    ведь в заказ вложены товары
+    """
+    version = User.objects.filter(id=request.user.id).values_list(
+        "orders_version", flat=True
+    ).first()
+    return (f"{request.user.id}.{version}-{catalog_digest()}-"
+            f"{request.accepted_renderer.format}")
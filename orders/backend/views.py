@@ -1,29 +1,56 @@
+from collections import defaultdict
+
+from django.conf import settings
 from django.contrib.auth import authenticate
 from django.contrib.auth.password_validation import validate_password
-from django.db import IntegrityError
-from django.db.models import Q, Sum, F
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, OuterRef, Q
 from django.http import JsonResponse
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 from drf_spectacular.utils import extend_schema
 from rest_framework.authtoken.models import Token
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.relations import PrimaryKeyRelatedField
 from rest_framework.response import Response
 from rest_framework.throttling import UserRateThrottle, AnonRateThrottle
 from rest_framework.views import APIView
 from rest_framework.viewsets import ReadOnlyModelViewSet, ModelViewSet
 from ujson import loads as load_json
 
+from .cache import cache_catalog_response
+from .facets import facet_counts, filter_by_parameters, parameter_filters
+from .fieldsets import (
+    CATALOG_EXPAND,
+    ORDER_EXPAND,
+    ORDER_FIELDS,
+    PRODUCT_INFO_FIELDS,
+    parse_fieldset,
+)
 from .models import (
+    CatalogItem,
     ConfirmEmailToken,
     Category,
+    ImportJob,
     Shop,
-    ProductInfo,
     Order,
     OrderItem,
     Contact,
+    ProductInfo,
     User,
 )
+from .pagination import ProductInfoPagination
 from .permissions import IsShop, IsOwner
+from .readers import (
+    catalog_columns,
+    catalog_item_data,
+    iter_order_data,
+    order_data,
+)
+from .search import search_products
 from .serializers import (
+    BasketItemSerializer,
+    CatalogItemSerializer,
     UserSerializer,
     CategorySerializer,
     ShopSerializer,
@@ -31,8 +58,59 @@ from .serializers import (
     OrderSerializer,
     OrderItemSerializer,
     ContactSerializer,
+    ImportJobSerializer,
 )
+from .streaming import stream_requested, streaming_json_response
 from .tasks import do_import, new_user_registered, new_order
+from .totals import freeze_prices, partner_order_totals, update_order_totals
+from .versions import bump_orders_version, catalog_etag, orders_etag
+
+# то же сообщение о неизвестном товаре, что у PrimaryKeyRelatedField
+DOES_NOT_EXIST = PrimaryKeyRelatedField.default_error_messages[
+    "does_not_exist"]
+
+
+def order_response(request, orders, read_path, columns=None):
+    """
+    Отдаем заказы в формате OrderSerializer с полями из ?fields=
+    и связями из ?expand=. Способ values собирает тот же JSON
+    из values() без моделей, serializer оставлен для сравнения.
+    columns подменяет значения полей аннотациями заказа
+    """
+    try:
+        fields, expand = parse_fieldset(request.query_params, ORDER_FIELDS,
+                                        ORDER_EXPAND)
+    except ValueError:
+        return JsonResponse({"Status": False,
+                             "Errors": "Неправильно указаны аргументы"})
+
+    if stream_requested(request):
+        return streaming_json_response(iter_order_data(
+            orders, fields, expand, settings.EXPORT_CHUNK_SIZE, columns
+        ))
+    if read_path == "values":
+        return Response(order_data(orders, fields, expand, columns))
+
+    if "ordered_items" in fields and "ordered_items" in expand:
+        lookups = ["ordered_items"]
+        if "product_info" in expand:
+            lookups = ["ordered_items__product_info__product__category"]
+        if {"product_info", "product_parameters"} <= expand:
+            lookups.append(
+                "ordered_items__product_info__product_parameters__parameter"
+            )
+        orders = orders.prefetch_related(*lookups)
+    if "contact" in fields and "contact" in expand:
+        orders = orders.select_related("contact")
+    if columns:
+        orders = list(orders)
+        for order in orders:
+            for field, column in columns.items():
+                setattr(order, field, getattr(order, column))
+    serializer = OrderSerializer(
+        orders, many=True, context={"fields": fields, "expand": expand}
+    )
+    return Response(serializer.data)
 
 
 class RegisterAccount(APIView):
@@ -182,6 +260,16 @@ class CategoryView(ReadOnlyModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
 
+    @method_decorator(condition(etag_func=catalog_etag))
+    @cache_catalog_response
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @method_decorator(condition(etag_func=catalog_etag))
+    @cache_catalog_response
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
 
 class ShopView(ReadOnlyModelViewSet):
     """
@@ -191,6 +279,14 @@ class ShopView(ReadOnlyModelViewSet):
     queryset = Shop.objects.filter(state=True)
     serializer_class = ShopSerializer
 
+    @cache_catalog_response
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cache_catalog_response
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
 
 class ProductInfoView(APIView):
     """
@@ -198,29 +294,113 @@ class ProductInfoView(APIView):
     """
 
     throttle_classes = (AnonRateThrottle,)
+    pagination_class = ProductInfoPagination
+    # fragments склеивает готовый JSON записей, values нужен для
+    # браузерного API и выборочных полей, serializer для сравнения
+    read_path = "fragments"
 
     @extend_schema(responses=ProductInfoSerializer)
+    @method_decorator(condition(etag_func=catalog_etag))
+    @cache_catalog_response
     def get(self, request, *args, **kwargs):
-        query = Q(shop__state=True)
+        query = Q(shop_state=True)
         shop_id = request.query_params.get("shop_id")
         category_id = request.query_params.get("category_id")
+        search = request.query_params.get("q", "").strip()
+        filters = parameter_filters(request.query_params)
 
         if shop_id:
             query = query & Q(shop_id=shop_id)
 
         if category_id:
-            query = query & Q(product__category_id=category_id)
-
-        queryset = (
-            ProductInfo.objects.filter(query)
-            .select_related("shop", "product__category")
-            .prefetch_related("product_parameters__parameter")
-            .distinct()
-        )
-
-        serializer = ProductInfoSerializer(queryset, many=True)
+            query = query & Q(category_id=category_id)
+        # таблица фасетов посчитана только по магазину и категории
+        facet_query = query
+
+        try:
+            if request.query_params.get("price_min"):
+                query = query & Q(
+                    price__gte=int(request.query_params["price_min"]))
+            if request.query_params.get("price_max"):
+                query = query & Q(
+                    price__lte=int(request.query_params["price_max"]))
+            fields, expand = parse_fieldset(request.query_params,
+                                            PRODUCT_INFO_FIELDS,
+                                            CATALOG_EXPAND)
+        except ValueError:
+            return JsonResponse({"Status": False,
+                                 "Errors": "Неправильно указаны аргументы"})
+        # нераскрытые параметры товара в ответ не попадают
+        fields = tuple(field for field in fields
+                       if field in expand or field not in CATALOG_EXPAND)
+
+        if request.query_params.get("in_stock") in ("1", "true"):
+            query = query & Q(quantity__gt=0)
+
+        queryset = CatalogItem.objects.filter(query)
+        if filters:
+            queryset = filter_by_parameters(queryset, filters)
+        if search:
+            queryset = search_products(queryset, search)
+
+        paginator = self.pagination_class()
+        if stream_requested(request):
+            # выгрузка целиком, без пагинации и фасетов
+            queryset = queryset.order_by(
+                *paginator.get_ordering(request, queryset, self)
+            )
+            chunk_size = settings.EXPORT_CHUNK_SIZE
+            if fields == PRODUCT_INFO_FIELDS:
+                items = queryset.values_list("fragment", flat=True).iterator(
+                    chunk_size=chunk_size
+                )
+            else:
+                rows = queryset.values(*catalog_columns(fields)).iterator(
+                    chunk_size=chunk_size
+                )
+                items = (catalog_item_data(row, fields) for row in rows)
+            return streaming_json_response(items)
+
+        # фасеты выдачи, суженной ценой, наличием, параметрами
+        # или поиском, считаем по ее записям. Фасеты отдаем только
+        # на первой странице, курсор их не меняет
+        narrowed = query != facet_query or filters or search
+        facets = {}
+        if paginator.cursor_query_param not in request.query_params:
+            facets["facets"] = facet_counts(
+                shop_id, category_id, queryset if narrowed else None)
+
+        if (self.read_path == "fragments"
+                and fields == PRODUCT_INFO_FIELDS
+                and request.accepted_renderer.format == "json"):
+            # готовые фрагменты и поля, по которым идет курсор
+            queryset = queryset.only("fragment", "price", "quantity",
+                                     "product_name")
+            page = paginator.paginate_queryset(queryset, request, view=self)
+            return paginator.get_fragment_response(
+                [item.fragment for item in page], **facets
+            )
 
-        return Response(serializer.data)
+        if self.read_path == "serializer":
+            deferred = ["fragment", "search_text", "search_vector"]
+            if "product_parameters" not in fields:
+                deferred.append("parameters")
+            queryset = queryset.defer(*deferred)
+            page = paginator.paginate_queryset(queryset, request, view=self)
+            serializer = CatalogItemSerializer(
+                page, many=True, context={"fields": fields, "expand": expand}
+            )
+            response = paginator.get_paginated_response(serializer.data)
+        else:
+            # частичный набор полей не совпадает с готовыми фрагментами
+            columns = catalog_columns(fields) + (("rank",) if search else ())
+            page = paginator.paginate_queryset(queryset.values(*columns),
+                                               request, view=self)
+            response = paginator.get_paginated_response(
+                [catalog_item_data(row, fields) for row in page]
+            )
+        response.data.update(facets)
+        return response
 
 
 class BasketView(APIView):
@@ -230,26 +410,13 @@ class BasketView(APIView):
 
     permission_classes = (IsAuthenticated,)
     throttle_classes = (UserRateThrottle,)
+    read_path = "values"
 
     @extend_schema(responses=OrderSerializer)
     def get(self, request, *args, **kwargs):
-        basket = (
-            Order.objects.filter(user_id=request.user.id, state="basket")
-            .prefetch_related(
-                "ordered_items__product_info__product__category",
-                "ordered_items__product_info__product_parameters__parameter",
-            )
-            .annotate(
-                total_sum=Sum(
-                    F("ordered_items__quantity")
-                    * F("ordered_items__product_info__price")
-                )
-            )
-            .distinct()
-        )
-
-        serializer = OrderSerializer(basket, many=True)
-        return Response(serializer.data)
+        basket = Order.objects.filter(user_id=request.user.id,
+                                      state="basket")
+        return order_response(request, basket, self.read_path)
 
     @extend_schema(responses=OrderItemSerializer)
     def post(self, request, *args, **kwargs):
@@ -262,30 +429,64 @@ class BasketView(APIView):
                     {"Status": False, "Errors": "Неверный формат запроса"}
                 )
             else:
-                basket, _ = Order.objects.get_or_create(
-                    user_id=request.user.id, state="basket"
-                )
-                objects_created = 0
-                for order_item in items_dict:
-                    order_item.update({"order": basket.id})
-                    serializer = OrderItemSerializer(data=order_item)
-                    if serializer.is_valid():
-                        try:
-                            serializer.save()
-                        except IntegrityError as error:
-                            return JsonResponse({"Status": False,
-                                                 "Errors": str(error)})
-                        else:
-                            objects_created += 1
-
-                    else:
-                        return JsonResponse(
-                            {"Status": False, "Errors": serializer.errors}
-                        )
-
-                return JsonResponse(
-                    {"Status": True, "Создано объектов": objects_created}
+                serializer = BasketItemSerializer(data=items_dict, many=True)
+                if not serializer.is_valid():
+                    return JsonResponse(
+                        {"Status": False, "Errors": serializer.errors}
+                    )
+                # повторы товара в запросе складываем
+                quantities = defaultdict(int)
+                for item in serializer.validated_data:
+                    quantities[item["product_info"]] += item["quantity"]
+                prices = dict(
+                    ProductInfo.objects.filter(id__in=quantities)
+                    .values_list("id", "price")
                 )
+                missing = quantities.keys() - prices.keys()
+                if missing:
+                    return JsonResponse({"Status": False, "Errors": {
+                        "product_info": [
+                            str(DOES_NOT_EXIST.format(pk_value=pk))
+                            for pk in sorted(missing)
+                        ]
+                    }})
+
+                with transaction.atomic():
+                    # блокируем корзину, чтобы параллельное добавление
+                    # не потеряло количество
+                    basket, _ = (
+                        Order.objects.select_for_update()
+                        .get_or_create(user_id=request.user.id,
+                                       state="basket")
+                    )
+                    in_basket = dict(
+                        OrderItem.objects.filter(
+                            order_id=basket.id, product_info_id__in=quantities
+                        ).values_list("product_info_id", "quantity")
+                    )
+                    OrderItem.objects.bulk_create(
+                        [
+                            OrderItem(
+                                order_id=basket.id,
+                                product_info_id=product_info_id,
+                                quantity=(in_basket.get(product_info_id, 0)
+                                          + quantity),
+                                price=prices[product_info_id],
+                            )
+                            for product_info_id, quantity in quantities.items()
+                        ],
+                        update_conflicts=True,
+                        unique_fields=["order", "product_info"],
+                        update_fields=["quantity", "price"],
+                    )
+                    update_order_totals([basket.id])
+                    bump_orders_version([request.user.id])
+                # товары, которые уже были в корзине, обновлены
+                return JsonResponse({
+                    "Status": True,
+                    "Создано объектов": len(quantities) - len(in_basket),
+                    "Обновлено объектов": len(in_basket),
+                })
         return JsonResponse(
             {"Status": False, "Errors": "Не указаны все необходимые аргументы"}
         )
@@ -337,6 +538,9 @@ class BasketView(APIView):
                         objects_updated += OrderItem.objects.filter(
                             order_id=basket.id, id=order_item["id"]
                         ).update(quantity=order_item["quantity"])
+                if objects_updated:
+                    update_order_totals([basket.id])
+                    bump_orders_version([request.user.id])
 
                 return JsonResponse(
                     {"Status": True, "Обновлено объектов": objects_updated}
@@ -361,19 +565,39 @@ class PartnerUpdate(APIView):
     def post(self, request, *args, **kwargs):
         url = request.data.get("url")
         if url:
+            job = ImportJob.objects.create(user_id=request.user.id, url=url)
             try:
-                do_import.delay(url, request.user.id)
+                do_import.delay(url, request.user.id, job.id)
             except IntegrityError as error:
                 return JsonResponse(
                     {"Status": False, "Errors": f"Integrity error: {error}"}
                 )
-            return JsonResponse({"Status": True})
+            return JsonResponse({"Status": True, "Job": job.id})
 
         return JsonResponse(
             {"Status": False, "Errors": "Не указаны все необходимые аргументы"}
         )
 
 
+class PartnerImportJob(APIView):
+    """
+    Класс для получения состояния задачи импорта прайса
+    """
+
+    permission_classes = (
+        IsAuthenticated,
+        IsShop,
+    )
+    throttle_classes = (UserRateThrottle,)
+
+    @extend_schema(responses=ImportJobSerializer)
+    def get(self, request, pk, *args, **kwargs):
+        job = ImportJob.objects.filter(id=pk, user_id=request.user.id).first()
+        if job:
+            return Response(ImportJobSerializer(job).data)
+        return JsonResponse({"Status": False, "Errors": "Задача не найдена"})
+
+
 class PartnerState(ModelViewSet):
     """
     Класс для работы со статусом поставщика
@@ -398,29 +622,21 @@ class PartnerOrders(APIView):
         IsShop,
     )
     throttle_classes = (UserRateThrottle,)
+    read_path = "values"
 
     def get(self, request, *args, **kwargs):
+        items = OrderItem.objects.filter(
+            order=OuterRef("pk"), product_info__shop__user_id=request.user.id
+        )
+        # поставщик видит сумму и число только своих позиций заказа
         order = (
-            Order.objects.filter(
-                ordered_items__product_info__shop__user_id=request.user.id
-            )
-            .exclude(state="basket")
-            .prefetch_related(
-                "ordered_items__product_info__product__category",
-                "ordered_items__product_info__product_parameters__parameter",
-            )
-            .select_related("contact")
-            .annotate(
-                total_sum=Sum(
-                    F("ordered_items__quantity")
-                    * F("ordered_items__product_info__price")
-                )
-            )
-            .distinct()
+            Order.objects.filter(Exists(items)).exclude(state="basket")
+            .annotate(**partner_order_totals(request.user.id))
         )
-
-        serializer = OrderSerializer(order, many=True)
-        return Response(serializer.data)
+        return order_response(request, order, self.read_path, {
+            "total_sum": "partner_total_sum",
+            "item_count": "partner_item_count",
+        })
 
 
 class ContactView(APIView):
@@ -503,37 +719,33 @@ class OrderView(APIView):
 
     permission_classes = (IsAuthenticated,)
     throttle_classes = (UserRateThrottle,)
+    read_path = "values"
 
     @extend_schema(responses=OrderSerializer)
+    @method_decorator(condition(etag_func=orders_etag))
     def get(self, request, *args, **kwargs):
-        order = (
-            Order.objects.filter(user_id=request.user.id)
-            .exclude(state="basket")
-            .prefetch_related(
-                "ordered_items__product_info__product__category",
-                "ordered_items__product_info__product_parameters__parameter",
-            )
-            .select_related("contact")
-            .annotate(
-                total_sum=Sum(
-                    F("ordered_items__quantity")
-                    * F("ordered_items__product_info__price")
-                )
-            )
-            .distinct()
+        order = Order.objects.filter(user_id=request.user.id).exclude(
+            state="basket"
         )
-
-        serializer = OrderSerializer(order, many=True)
-        return Response(serializer.data)
+        return order_response(request, order, self.read_path)
 
     @extend_schema()
     def post(self, request, *args, **kwargs):
         if {"id", "contact"}.issubset(request.data):
             if request.data["id"].isdigit():
                 try:
-                    is_updated = Order.objects.filter(
-                        user_id=request.user.id, id=request.data["id"]
-                    ).update(contact_id=request.data["contact"], state="new")
+                    with transaction.atomic():
+                        # при оформлении фиксируем цены корзины
+                        freeze_prices(OrderItem.objects.filter(
+                            order__user_id=request.user.id,
+                            order_id=request.data["id"],
+                            order__state="basket",
+                        ))
+                        update_order_totals([request.data["id"]])
+                        is_updated = Order.objects.filter(
+                            user_id=request.user.id, id=request.data["id"]
+                        ).update(contact_id=request.data["contact"],
+                                 state="new")
                 except IntegrityError as error:
                     print(error)
                     return JsonResponse(
@@ -542,6 +754,7 @@ class OrderView(APIView):
                     )
                 else:
                     if is_updated:
+                        bump_orders_version([request.user.id])
                         new_order.delay(sender=self.__class__,
                                         user_id=request.user.id)
                         return JsonResponse({"Status": True})
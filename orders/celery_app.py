@@ -7,4 +7,5 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "orders.settings")
 app = Celery("orders")
 app.config_from_object("django.conf:settings")
 app.conf.broker_url = settings.CELERY_BROKER_URL
+app.conf.result_backend = settings.CELERY_RESULT_BACKEND
 app.autodiscover_tasks()
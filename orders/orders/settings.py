@@ -37,6 +37,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "rest_framework",
     "rest_framework.authtoken",
     "django_rest_passwordreset",
@@ -172,6 +173,10 @@ REST_FRAMEWORK = {
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
 }
 
+CATALOG_MAX_PAGE_SIZE = 200
+# строк за одно чтение курсором при потоковой выгрузке
+EXPORT_CHUNK_SIZE = 1000
+
 AUTHENTICATION_BACKENDS = (
     "django.contrib.auth.backends.ModelBackend",
     "allauth.account.auth_backends.AuthenticationBackend",
@@ -182,7 +187,30 @@ SOCIALACCOUNT_PROVIDERS = {
     "google": {"APP": {"client_id": "3", "secret": "4", "key": ""}},
 }
 
+# shared cache for catalog responses and throttling; local memory if unset
+if os.environ.get("CACHE_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ.get("CACHE_URL"),
+        }
+    }
+
+CATALOG_CACHE_TIMEOUT = 15 * 60
+
 CELERY_BROKER_URL = "redis://redis:6379/0"
+CELERY_RESULT_BACKEND = "redis://redis:6379/1"
+
+IMPORT_CHUNK_SIZE = 1000
+# a running import older than this no longer blocks the shop, seconds
+IMPORT_LOCK_TIMEOUT = 60 * 60
+# (connect, read) timeouts for a single request to the partner, seconds
+IMPORT_FETCH_TIMEOUT = (5, 60)
+IMPORT_FETCH_MAX_TIME = 600
+IMPORT_FETCH_CHUNK_SIZE = 64 * 1024
+IMPORT_FEED_MAX_SIZE = 1024 * 1024 * 1024
+# feeds larger than this are spooled from memory to disk
+IMPORT_SPOOL_SIZE = 16 * 1024 * 1024
 
 SPECTACULAR_SETTINGS = {
     "TITLE": "final diplom",
@@ -0,0 +1,46 @@
+import pytest
+from yaml import load as load_yaml, SafeLoader
+
+from backend.importer import import_feed
+from backend.models import Contact, Order, OrderItem, ProductInfo
+from backend.totals import update_order_totals
+
+from .helpers import FEED_PATH, iter_data
+
+
+@pytest.fixture
+def feed():
+    with open(FEED_PATH, encoding="utf-8") as file:
+        return load_yaml(file, Loader=SafeLoader)
+
+
+@pytest.fixture
+def catalog(db, django_user_model, feed):
+    partner = django_user_model.objects.create_user(
+        email="partner_email@mail.ru",
+        password="partner_pass",
+        user_type="shop",
+    )
+    import_feed(iter_data(feed), partner.id)
+    return feed
+
+
+@pytest.fixture
+def orders(catalog, django_user_model):
+    partner = django_user_model.objects.get(email="partner_email@mail.ru")
+    buyer = django_user_model.objects.create_user(
+        email="buyer_email@mail.ru", password="buyer_pass", is_active=True
+    )
+    contact = Contact.objects.create(user=buyer, city="Москва",
+                                     street="Тверская", phone="+7900")
+    product_infos = list(ProductInfo.objects.order_by("id"))
+    for state in ("basket", "new", "delivered"):
+        order = Order.objects.create(user=buyer, state=state,
+                                     contact=contact)
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, product_info=product_info,
+                      quantity=index + 1, price=product_info.price)
+            for index, product_info in enumerate(product_infos)
+        )
+        update_order_totals([order.id])
+    return buyer, partner
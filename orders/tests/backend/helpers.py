@@ -0,0 +1,35 @@
+import os
+
+from django.core.cache import cache
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+FEED_PATH = os.path.join(os.path.dirname(__file__), "..", "..",
+                         "data", "shop1.yaml")
+
+
+def iter_data(data):
+    """
+    Отдаем записи из уже загруженного прайса
+    """
+    yield "shop", data["shop"]
+    for category in data["categories"]:
+        yield "category", category
+    for item in data["goods"]:
+        yield "good", item
+
+
+def render(view_class, read_path, user=None, **params):
+    cache.clear()
+    request = APIRequestFactory().get("/api/v1/view", params)
+    if user is not None:
+        force_authenticate(request, user=user)
+    response = view_class.as_view(read_path=read_path)(request)
+    if hasattr(response, "render"):
+        response.render()
+    assert response.status_code == 200
+    return response.content
+
+
+def streamed(response):
+    assert response.status_code == 200 and response.streaming
+    return b"".join(response.streaming_content)
@@ -1,9 +1,19 @@
+import json
+
 import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from model_bakery import baker
 from rest_framework.test import APIClient
 from rest_framework.authtoken.models import Token
 
+from backend.importer import import_feed
+from backend.models import ProductInfo
+from backend.views import BasketView, OrderView, PartnerOrders
+
+from .helpers import iter_data, render, streamed
+
 
 @pytest.fixture
 def client():
@@ -120,6 +130,98 @@ def test_add_into_basket(user, auth_client, order_factory,
     assert response_json["Status"] is True
 
 
+@pytest.mark.django_db
+def test_order_totals_follow_items(user, auth_client, product_info_factory,
+                                   monkeypatch):
+    monkeypatch.setattr("backend.views.new_order.delay",
+                        lambda **kwargs: None)
+    product_info = product_info_factory()
+    product_info.price = 100
+    product_info.save()
+    contact = baker.make("Contact", user=user)
+    url = reverse("backend:basket")
+    auth_client.post(url, {"items": f'[{{"product_info": {product_info.id}, '
+                                    f'"quantity": 2}}]'})
+    basket = user.orders.get(state="basket")
+    assert (basket.total_sum, basket.item_count) == (2 * product_info.price,
+                                                     1)
+
+    # в корзине цена следует за товаром
+    product_info.price += 10
+    product_info.save()
+    basket.refresh_from_db()
+    assert basket.total_sum == 2 * product_info.price
+
+    # при оформлении цена фиксируется, новый прайс заказ не меняет
+    response = auth_client.post(reverse("backend:order"),
+                                {"id": str(basket.id), "contact": contact.id})
+    assert response.json()["Status"] is True
+    total_sum = 2 * product_info.price
+    product_info.price += 10
+    product_info.save()
+    order = auth_client.get(reverse("backend:order")).json()[0]
+    assert (order["total_sum"], order["item_count"]) == (total_sum, 1)
+    assert order["ordered_items"][0]["price"] == total_sum // 2
+
+    item = basket.ordered_items.get()
+    item.delete()
+    basket.refresh_from_db()
+    assert (basket.total_sum, basket.item_count) == (0, 0)
+
+
+@pytest.mark.django_db
+def test_basket_prices_follow_import(catalog, user, auth_client):
+    product_info = ProductInfo.objects.get(
+        external_id=catalog["goods"][0]["id"])
+    auth_client.post(reverse("backend:basket"), {"items": json.dumps(
+        [{"product_info": product_info.id, "quantity": 2}])})
+    partner = product_info.shop.user
+    goods = [dict(catalog["goods"][0], price=product_info.price + 10),
+             *catalog["goods"][1:]]
+    import_feed(iter_data(dict(catalog, goods=goods)), partner.id)
+
+    basket = auth_client.get(reverse("backend:basket")).json()[0]
+    item = basket["ordered_items"][0]
+    assert item["price"] == item["product_info"]["price"] == goods[0]["price"]
+    assert basket["total_sum"] == 2 * goods[0]["price"]
+
+
+@pytest.mark.django_db
+def test_bulk_add_into_basket(catalog, user, auth_client):
+    ids = list(ProductInfo.objects.order_by("id")
+               .values_list("id", flat=True))
+    url = reverse("backend:basket")
+
+    def add(items):
+        with CaptureQueriesContext(connection) as context:
+            response = auth_client.post(url, {"items": json.dumps(items)})
+        return response.json(), len(backend_queries(context))
+
+    data, _ = add([{"product_info": ids[0], "quantity": 1}])
+    assert data == {"Status": True, "Создано объектов": 1,
+                    "Обновлено объектов": 0}
+    _, one_item_queries = add([{"product_info": ids[0], "quantity": 1}])
+    data, queries = add([{"product_info": pk, "quantity": 2} for pk in ids]
+                        + [{"product_info": ids[0], "quantity": 1}])
+    assert data == {"Status": True, "Создано объектов": len(ids) - 1,
+                    "Обновлено объектов": 1}
+    assert queries == one_item_queries
+
+    basket = user.orders.get(state="basket")
+    items = {item.product_info_id: item for item in basket.ordered_items.all()}
+    assert {pk: item.quantity for pk, item in items.items()} == {
+        **{pk: 2 for pk in ids}, ids[0]: 5}
+    assert basket.item_count == len(ids)
+    assert basket.total_sum == sum(item.quantity * item.price
+                                   for item in items.values())
+
+    # неизвестный товар отклоняет всю корзину
+    data, _ = add([{"product_info": ids[0], "quantity": 1},
+                   {"product_info": max(ids) + 1, "quantity": 1}])
+    assert data["Status"] is False
+    assert basket.ordered_items.get(product_info_id=ids[0]).quantity == 5
+
+
 @pytest.mark.django_db
 def test_get_partner_status(auth_partner):
     url = "/api/v1/partner/state/"
@@ -155,3 +257,166 @@ def test_thanks(auth_client):
     response_json = response.json()
     assert response.status_code == 200
     assert response_json["Message"] == "user1, Спасибо за ваш заказ!"
+
+
+@pytest.mark.django_db
+def test_products_cursor_pagination(client, product_info_factory):
+    product_ids = sorted(product_info_factory().id for _ in range(5))
+    url = "/api/v1/products?page_size=2"
+    seen = []
+    while url:
+        response = client.get(url)
+        assert response.status_code == 200
+        response_json = response.json()
+        assert len(response_json["results"]) <= 2
+        seen.extend(item["id"] for item in response_json["results"])
+        url = response_json["next"]
+    assert seen == product_ids
+
+
+def backend_queries(context):
+    # версии магазинов для ETag читаются при каждом запросе
+    return [query["sql"] for query in context.captured_queries
+            if '"backend_' in query["sql"]
+            and '"backend_shop"."catalog_version"' not in query["sql"]
+            and "silk_" not in query["sql"]]
+
+
+@pytest.mark.django_db
+def test_products_cached_until_catalog_changes(
+        client, product_info_factory, django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks(execute=True):
+        product_info_factory()
+    url = "/api/v1/products"
+    assert len(client.get(url).json()["results"]) == 1
+    with CaptureQueriesContext(connection) as context:
+        assert len(client.get(url).json()["results"]) == 1
+    assert not backend_queries(context)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        product_info_factory()
+    assert len(client.get(url).json()["results"]) == 2
+
+
+@pytest.mark.django_db
+def test_categories_cache_key_normalized(client, category_factory):
+    category_factory()
+    client.get("/api/v1/categories/?a=1&b=2")
+    with CaptureQueriesContext(connection) as context:
+        response = client.get("/api/v1/categories/?b=2&a=1")
+    assert response.status_code == 200
+    assert not backend_queries(context)
+
+
+@pytest.mark.django_db
+def test_products_conditional_get(client, product_info_factory):
+    product_info = product_info_factory()
+    url = "/api/v1/products"
+    etag = client.get(url)["ETag"]
+    assert etag.startswith('"')
+    with CaptureQueriesContext(connection) as context:
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304
+    assert not backend_queries(context)
+
+    other = product_info_factory()
+    shop_url = f"{url}?shop_id={product_info.shop_id}"
+    shop_etag = client.get(shop_url)["ETag"]
+    other.price += 1
+    other.save()
+    assert client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 200
+    assert client.get(shop_url,
+                      HTTP_IF_NONE_MATCH=shop_etag).status_code == 304
+    product_info.product.name = "Новое название"
+    product_info.product.save()
+    assert client.get(shop_url,
+                      HTTP_IF_NONE_MATCH=shop_etag).status_code == 200
+
+
+@pytest.mark.django_db
+def test_categories_conditional_get(client, category_factory,
+                                    shop_factory):
+    category = category_factory()
+    shop_factory()
+    url = "/api/v1/categories/"
+    etag = client.get(url)["ETag"]
+    assert client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 304
+    category.name = "Другая категория"
+    category.save()
+    assert client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 200
+
+
+@pytest.mark.django_db
+def test_orders_conditional_get(user, auth_client, order_factory,
+                                product_info_factory):
+    order = order_factory(user=user, state="new")
+    product_info = product_info_factory()
+    url = reverse("backend:order")
+    etag = auth_client.get(url)["ETag"]
+    with CaptureQueriesContext(connection) as context:
+        response = auth_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304
+    assert not any('"backend_order' in query["sql"]
+                   for query in context.captured_queries)
+
+    item = baker.make("OrderItem", order=order, product_info=product_info,
+                      quantity=1)
+    response = auth_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    etag = response["ETag"]
+    product_info.price += 1
+    product_info.save()
+    response = auth_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    etag = response["ETag"]
+    item.delete()
+    assert auth_client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 200
+
+
+@pytest.mark.django_db
+def test_order_read_paths_are_identical(orders):
+    buyer, partner = orders
+    for view_class, user in ((BasketView, buyer), (OrderView, buyer),
+                             (PartnerOrders, partner)):
+        expected = render(view_class, "serializer", user)
+        assert render(view_class, "values", user) == expected
+        assert b"product_parameters" in expected
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("params, keys, product_info", [
+    ({"fields": "id,state,total_sum"}, ["id", "state", "total_sum"], None),
+    ({"expand": "ordered_items,contact"},
+     ["id", "ordered_items", "state", "created_at", "total_sum",
+      "item_count", "contact"], int),
+    ({"fields": "id,ordered_items", "expand": "ordered_items,product_info"},
+     ["id", "ordered_items"], dict),
+])
+def test_order_sparse_fieldsets(orders, params, keys, product_info):
+    buyer, _ = orders
+    expected = render(OrderView, "serializer", buyer, **params)
+    with CaptureQueriesContext(connection) as context:
+        content = render(OrderView, "values", buyer, **params)
+    assert content == expected
+    assert not any("backend_productparameter" in query["sql"]
+                   for query in context.captured_queries)
+    order = json.loads(content)[0]
+    assert list(order) == keys
+    if product_info:
+        item = order["ordered_items"][0]
+        assert isinstance(item["product_info"], product_info)
+        if product_info is dict:
+            assert "product_parameters" not in item["product_info"]
+
+
+@pytest.mark.django_db
+def test_order_stream_export(orders, settings):
+    settings.EXPORT_CHUNK_SIZE = 1
+    buyer, partner = orders
+    for url, user in (("/api/v1/order", buyer),
+                      ("/api/v1/partner/orders", partner)):
+        client = APIClient()
+        client.force_authenticate(user)
+        expected = client.get(url).content
+        assert len(json.loads(expected)) == 2
+        assert streamed(client.get(url, {"stream": "true"})) == expected
@@ -0,0 +1,51 @@
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+
+from backend.feed import iter_feed
+
+
+def test_generate_feed(tmp_path):
+    path = tmp_path / "feed.yaml"
+    call_command("generate_feed", str(path), goods=25, categories=3,
+                 parameters=2, stdout=StringIO())
+    with open(path, "rb") as file:
+        records = list(iter_feed(file))
+    goods = [record for kind, record in records if kind == "good"]
+    categories = [record for kind, record in records if kind == "category"]
+    assert records[0] == ("shop", "Тестовый магазин")
+    assert len(goods) == 25
+    assert len(categories) == 3
+    assert all(len(item["parameters"]) == 2 for item in goods)
+    assert {item["category"] for item in goods} <= {
+        category["id"] for category in categories
+    }
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("mode", ["stream", "chunks"])
+def test_benchmark_import(tmp_path, mode):
+    path = tmp_path / "feed.yaml"
+    call_command("generate_feed", str(path), goods=10, stdout=StringIO())
+    out = StringIO()
+    call_command("benchmark_import", str(path), runs=2, mode=mode,
+                 chunk_size=4, stdout=out)
+    first, second = out.getvalue().splitlines()
+    assert "created 10" in first
+    assert "unchanged 10" in second
+    assert "queries" in first and "rows/s" in first
+    assert "peak python memory" in first and "peak python memory" in second
+
+
+@pytest.mark.django_db
+def test_benchmark_reads(tmp_path):
+    path = tmp_path / "feed.yaml"
+    call_command("generate_feed", str(path), goods=10, stdout=StringIO())
+    call_command("benchmark_import", str(path), runs=1, stdout=StringIO())
+    out = StringIO()
+    call_command("benchmark_reads", orders=3, items=4, runs=1, stdout=out)
+    comparisons = [line for line in out.getvalue().splitlines()
+                   if "vs serializer" in line]
+    assert len(comparisons) == 5
+    assert all(line.endswith("identical") for line in comparisons)
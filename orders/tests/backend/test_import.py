@@ -0,0 +1,449 @@
+import gzip
+import threading
+from collections import defaultdict
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+from django.utils import timezone
+
+from backend.cache import catalog_version
+from backend.feed import (
+    FeedError,
+    fetch_feed,
+    iter_feed,
+    open_feed,
+)
+from backend.importer import (
+    ImportCache,
+    claim_job,
+    finalize_import,
+    import_feed,
+    prepare_import,
+    write_chunk,
+)
+from backend.models import (
+    Category,
+    ImportItem,
+    ImportJob,
+    Product,
+    Parameter,
+    ProductInfo,
+    ProductParameter,
+    Shop,
+)
+from backend.tasks import (
+    do_import,
+    finish_import,
+    import_chunk,
+    import_failed,
+)
+from celery_app import app
+from rest_framework.test import APIClient
+
+from .helpers import FEED_PATH, iter_data
+
+
+@pytest.fixture
+def partner(db, django_user_model):
+    return django_user_model.objects.create_user(
+        email="partner_email@mail.ru",
+        password="partner_pass",
+        user_type="shop",
+    )
+
+
+class FeedHandler(BaseHTTPRequestHandler):
+    etag = '"shop1"'
+    conditional = True
+    gzip_encoding = False
+    requests = []
+
+    def do_GET(self):
+        self.requests.append(dict(self.headers))
+        if self.path.endswith("/missing"):
+            self.send_response(404)
+            self.end_headers()
+            return
+        if self.conditional and self.headers.get("If-None-Match") == self.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        with open(FEED_PATH, "rb") as file:
+            body = file.read()
+        if self.path.endswith(".gz") or self.gzip_encoding:
+            body = gzip.compress(body)
+        self.send_response(200)
+        self.send_header("ETag", self.etag)
+        if self.gzip_encoding:
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def feed_server():
+    FeedHandler.conditional = True
+    FeedHandler.gzip_encoding = False
+    FeedHandler.requests = []
+    server = HTTPServer(("127.0.0.1", 0), FeedHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/shop1.yaml"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def eager_celery():
+    app.conf.task_always_eager = True
+    yield
+    app.conf.task_always_eager = False
+
+
+@pytest.mark.django_db
+def test_import_feed(partner, feed):
+    result = import_feed(iter_data(feed), partner.id)
+    assert result["goods"] == len(feed["goods"])
+    assert ProductInfo.objects.filter(shop_id=result["shop_id"]).count() == (
+        len(feed["goods"])
+    )
+    assert ProductParameter.objects.count() == sum(
+        len(item["parameters"]) for item in feed["goods"]
+    )
+    assert Category.objects.filter(shops=result["shop_id"]).count() == (
+        len(feed["categories"])
+    )
+
+
+@pytest.mark.django_db
+def test_import_feed_reimport(partner, feed):
+    import_feed(iter_data(feed), partner.id)
+    result = import_feed(iter_data(feed), partner.id)
+    assert ProductInfo.objects.count() == len(feed["goods"])
+    assert result["goods"] == len(feed["goods"])
+
+
+@pytest.mark.django_db
+def test_import_feed_query_count(partner, feed,
+                                 django_assert_max_num_queries):
+    feed["goods"] = feed["goods"] * 5
+    for number, item in enumerate(feed["goods"]):
+        feed["goods"][number] = dict(item, id=number)
+    with django_assert_max_num_queries(30):
+        import_feed(iter_data(feed), partner.id)
+
+
+def test_iter_feed_matches_full_load(feed):
+    with open(FEED_PATH, encoding="utf-8") as file:
+        records = list(iter_feed(file))
+    assert records == list(iter_data(feed))
+
+
+def test_iter_feed_rejects_non_mapping():
+    with pytest.raises(FeedError):
+        list(iter_feed("- shop\n- goods\n"))
+
+
+@pytest.mark.django_db
+def test_import_feed_streams_file(partner, feed):
+    with open(FEED_PATH, encoding="utf-8") as file:
+        result = import_feed(iter_feed(file), partner.id)
+    assert result["goods"] == len(feed["goods"])
+
+
+@pytest.mark.django_db
+def test_import_feed_sync_diff(partner, feed):
+    first = import_feed(iter_data(feed), partner.id)
+    assert first["created"] == len(feed["goods"])
+    kept = ProductInfo.objects.get(external_id=feed["goods"][2]["id"])
+
+    removed = feed["goods"].pop(0)
+    feed["goods"][0] = dict(feed["goods"][0], price=1)
+    feed["goods"][1] = dict(feed["goods"][1],
+                            parameters={"Цвет": "зеленый"})
+    feed["goods"].append(dict(removed, id=1))
+
+    result = import_feed(iter_data(feed), partner.id)
+    assert result["created"] == 1
+    assert result["updated"] == 2
+    assert result["deleted"] == 1
+    assert result["unchanged"] == len(feed["goods"]) - 3
+    assert ProductInfo.objects.filter(pk=kept.pk).exists()
+    assert not ProductInfo.objects.filter(
+        external_id=removed["id"]).exists()
+    assert ProductInfo.objects.get(
+        external_id=feed["goods"][0]["id"]).price == 1
+
+
+@pytest.mark.django_db
+def test_import_feed_sync_unchanged(partner, feed):
+    import_feed(iter_data(feed), partner.id)
+    result = import_feed(iter_data(feed), partner.id)
+    assert result["unchanged"] == len(feed["goods"])
+    assert result["created"] == result["updated"] == result["deleted"] == 0
+
+
+@pytest.mark.django_db
+def test_parallel_import_phases(partner, feed):
+    import_feed(iter_data(feed), partner.id)
+    removed = feed["goods"].pop()
+    feed["goods"][0] = dict(feed["goods"][0], quantity=0)
+    feed["goods"].append(dict(feed["goods"][1], id=removed["id"] + 1000,
+                              name="Новый продукт"))
+
+    job = ImportJob.objects.create(user=partner, url="")
+    timings = defaultdict(float)
+    prepared = prepare_import(iter_data(feed), partner.id, job.id,
+                              chunk_size=3, timings=timings)
+    assert prepared["chunks"] == -(-len(feed["goods"]) // 3)
+    # подготовка только пишет, сравнение идет в частях
+    assert timings["write_time"] > 0
+    assert "diff_time" not in timings
+    assert job.items.count() == len(feed["goods"])
+    # продукты создает подготовка, части их только используют
+    products = Product.objects.count()
+    results = [write_chunk(prepared["shop_id"], job.id, chunk)
+               for chunk in range(prepared["chunks"])]
+    summary = finalize_import(results, prepared["shop_id"], job.id)
+    assert summary["goods"] == len(feed["goods"])
+    assert (summary["created"], summary["updated"]) == (1, 1)
+    assert summary["deleted"] == 1
+    assert Product.objects.count() == products
+    assert ProductInfo.objects.count() == len(feed["goods"])
+    assert not ProductInfo.objects.filter(external_id=removed["id"]).exists()
+    assert not job.items.exists()
+
+
+@pytest.mark.django_db
+def test_do_import_runs_chord(partner, feed, settings, feed_server,
+                              eager_celery):
+    settings.IMPORT_CHUNK_SIZE = 2
+    do_import.delay(feed_server, partner.id)
+    assert ProductInfo.objects.count() == len(feed["goods"])
+    shop = Shop.objects.get(user=partner)
+    assert shop.feed_etag == FeedHandler.etag
+    assert shop.feed_digest
+
+
+@pytest.mark.django_db
+def test_partner_update_job(partner, feed, feed_server, eager_celery):
+    client = APIClient()
+    client.force_authenticate(user=partner)
+    response = client.post("/api/v1/partner/update", {"url": feed_server})
+    job_id = response.json()["Job"]
+
+    response = client.get(f"/api/v1/partner/update/{job_id}")
+    assert response.status_code == 200
+    job = response.json()
+    assert job["state"] == "done"
+    assert job["goods_count"] == job["created_count"] == len(feed["goods"])
+    assert job["shop"] == Shop.objects.get(user=partner).id
+    assert job["finished_at"]
+
+    # задача запрашивается только по номеру
+    response = client.get("/api/v1/partner/update")
+    assert response.status_code == 405
+
+
+@pytest.mark.django_db
+def test_do_import_failed_job(partner, feed_server, eager_celery):
+    result = do_import.delay(feed_server + "/missing", partner.id).get()
+    assert result["Status"] is False
+    job = ImportJob.objects.get(id=result["Job"])
+    assert job.state == "failed"
+    assert "404" in job.error
+
+
+@pytest.mark.django_db
+def test_do_import_skips_not_modified(partner, feed_server, eager_celery):
+    do_import.delay(feed_server, partner.id)
+    ProductInfo.objects.all().delete()
+
+    result = do_import.delay(feed_server, partner.id).get()
+    assert FeedHandler.requests[-1]["If-None-Match"] == FeedHandler.etag
+    assert result["Changed"] is False
+    assert ImportJob.objects.get(id=result["Job"]).state == "skipped"
+    assert not ProductInfo.objects.exists()
+
+
+@pytest.mark.django_db
+def test_do_import_skips_same_digest(partner, feed_server, eager_celery):
+    FeedHandler.conditional = False
+    do_import.delay(feed_server, partner.id)
+    ProductInfo.objects.all().delete()
+
+    result = do_import.delay(feed_server, partner.id).get()
+    assert result["Changed"] is False
+    assert not ProductInfo.objects.exists()
+
+
+@pytest.mark.parametrize("gzip_encoding, suffix", [(True, ""), (False, ".gz")])
+def test_fetch_feed_gzip(feed, feed_server, gzip_encoding, suffix):
+    FeedHandler.gzip_encoding = gzip_encoding
+    download = fetch_feed(feed_server + suffix)
+    with download.file as file:
+        assert list(iter_feed(open_feed(file))) == list(iter_data(feed))
+    assert FeedHandler.requests[-1]["Accept-Encoding"] == "gzip"
+
+
+def test_fetch_feed_max_size(feed_server, settings):
+    settings.IMPORT_FEED_MAX_SIZE = 100
+    with pytest.raises(FeedError):
+        fetch_feed(feed_server)
+
+
+@pytest.mark.django_db
+def test_import_cache_repeated_lookups(partner, feed,
+                                       django_assert_num_queries):
+    import_feed(iter_data(feed), partner.id)
+    cache = ImportCache(Shop.objects.get(user=partner))
+    with django_assert_num_queries(0):
+        cache.link_categories(feed["categories"])
+        cache.resolve_products(feed["goods"])
+        cache.resolve_parameters(
+            name for item in feed["goods"] for name in item["parameters"]
+        )
+
+
+@pytest.mark.django_db
+def test_import_cache_without_preload(partner, feed,
+                                      django_assert_num_queries):
+    import_feed(iter_data(feed), partner.id)
+    parameters = Parameter.objects.count()
+    shop = Shop.objects.get(user=partner)
+    with django_assert_num_queries(0):
+        cache = ImportCache(shop, preload=False)
+    names = set(feed["goods"][0]["parameters"])
+    # в базу идут только параметры, которые нужны этой части
+    with django_assert_num_queries(1):
+        resolved = cache.resolve_parameters(names)
+    assert resolved == dict(
+        Parameter.objects.filter(name__in=names).values_list("name", "id")
+    )
+    assert Parameter.objects.count() == parameters
+
+
+@pytest.mark.django_db
+def test_do_import_superseded_by_newer_job(partner, feed, feed_server,
+                                           eager_celery):
+    older = ImportJob.objects.create(user=partner, url=feed_server)
+    newer = ImportJob.objects.create(user=partner, url=feed_server)
+
+    # замененная задача сама запускает следующую в очереди
+    result = do_import.delay(feed_server, partner.id, older.id).get()
+    assert result["State"] == "superseded"
+    newer.refresh_from_db()
+    assert newer.state == "done"
+    assert ProductInfo.objects.count() == len(feed["goods"])
+
+
+@pytest.mark.django_db
+def test_do_import_waits_for_running_job(partner, feed, feed_server,
+                                         eager_celery):
+    running = ImportJob.objects.create(user=partner, url=feed_server,
+                                       state="running",
+                                       started_at=timezone.now())
+    queued = ImportJob.objects.create(user=partner, url=feed_server)
+
+    result = do_import.delay(feed_server, partner.id, queued.id).get()
+    assert result["State"] == "queued"
+    assert not ProductInfo.objects.exists()
+
+    shop = Shop.objects.create(name=feed["shop"], user=partner)
+    finish_import.delay([], shop.id, running.id)
+    running.refresh_from_db()
+    queued.refresh_from_db()
+    assert running.state == "done"
+    assert queued.state == "done"
+    assert ProductInfo.objects.count() == len(feed["goods"])
+
+
+@pytest.mark.django_db
+def test_queue_moves_after_lock_expired(partner, feed, feed_server,
+                                        eager_celery, settings):
+    started_at = timezone.now() - timedelta(
+        seconds=settings.IMPORT_LOCK_TIMEOUT + 1)
+    crashed = ImportJob.objects.create(user=partner, url=feed_server,
+                                       state="running",
+                                       started_at=started_at)
+    ImportItem.objects.create(job=crashed, chunk=0, external_id=1,
+                              data={})
+    older = ImportJob.objects.create(user=partner, url=feed_server)
+    newer = ImportJob.objects.create(user=partner, url=feed_server)
+
+    do_import.delay(feed_server, partner.id, older.id)
+    crashed.refresh_from_db()
+    older.refresh_from_db()
+    newer.refresh_from_db()
+    assert (crashed.state, older.state, newer.state) == (
+        "failed", "superseded", "done")
+    assert not ImportItem.objects.filter(job=crashed).exists()
+    assert ProductInfo.objects.count() == len(feed["goods"])
+
+
+@pytest.mark.django_db
+def test_claim_job_runs_job_once(partner, feed_server, eager_celery):
+    job = ImportJob.objects.create(user=partner, url=feed_server)
+    assert claim_job(job.id, partner.id) == "running"
+    # повторная доставка той же задачи не запускает второй импорт
+    assert claim_job(job.id, partner.id) is None
+    result = do_import.delay(feed_server, partner.id, job.id).get()
+    assert result["State"] is None
+    assert not ProductInfo.objects.exists()
+
+
+@pytest.mark.django_db
+def test_failed_chunk_fails_job_after_chord(partner, feed, feed_server,
+                                            eager_celery, monkeypatch):
+    def broken_chunk(shop_id, job_id, chunk):
+        raise ValueError("broken chunk")
+
+    monkeypatch.setattr("backend.tasks.write_chunk", broken_chunk)
+    running = ImportJob.objects.create(user=partner, url=feed_server,
+                                       state="running",
+                                       started_at=timezone.now())
+    queued = ImportJob.objects.create(user=partner, url=feed_server)
+    shop = Shop.objects.create(name=feed["shop"], user=partner)
+    # часть падает, но следующий импорт ждет завершения всей группы
+    with pytest.raises(ValueError):
+        import_chunk(shop.id, running.id, 0)
+    running.refresh_from_db()
+    queued.refresh_from_db()
+    assert (running.state, queued.state) == ("running", "queued")
+
+    # группа завершилась с ошибкой: задача падает, следующая стартует
+    monkeypatch.undo()
+    import_failed(None, ValueError("broken chunk"), None, job_id=running.id)
+    running.refresh_from_db()
+    queued.refresh_from_db()
+    assert (running.state, queued.state) == ("failed", "done")
+    assert "broken chunk" in running.error
+
+
+@pytest.mark.django_db
+def test_import_feed_bumps_catalog_version(
+        partner, feed, django_capture_on_commit_callbacks):
+    version = catalog_version()
+    with django_capture_on_commit_callbacks(execute=True):
+        import_feed(iter_data(feed), partner.id)
+    assert catalog_version() > version
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("kept", [150, 0])
+def test_import_feed_stale_query_count(partner, feed, kept,
+                                       django_assert_max_num_queries):
+    goods = feed["goods"] * 40
+    feed["goods"] = [dict(item, id=number)
+                     for number, item in enumerate(goods)]
+    import_feed(iter_data(feed), partner.id)
+    feed["goods"] = feed["goods"][:kept]
+    # удаление устаревших товаров не зависит от их числа
+    with django_assert_max_num_queries(30):
+        result = import_feed(iter_data(feed), partner.id)
+    assert result["deleted"] == len(goods) - kept
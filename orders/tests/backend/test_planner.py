@@ -0,0 +1,131 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from backend.models import Category, Order, OrderItem, ProductInfo, Shop
+
+
+def query_plan(sql):
+    # без последовательного сканирования планировщик берет любой
+    # подходящий индекс, а Seq Scan остается только там, где его нет
+    with connection.cursor() as cursor:
+        cursor.execute("SET LOCAL enable_seqscan = off")
+        cursor.execute(f"EXPLAIN {sql}")
+        return "\n".join(row[0] for row in cursor.fetchall())
+
+
+def hot_query(context, table):
+    return next(
+        query["sql"] for query in context.captured_queries
+        if query["sql"].startswith("SELECT")
+        and f'FROM "{table}"' in query["sql"]
+    )
+
+
+def assert_uses_index(sql, index):
+    plan = query_plan(sql)
+    assert "Seq Scan" not in plan
+    assert index in plan
+
+
+def get(url, user=None, **params):
+    client = APIClient()
+    if user is not None:
+        client.force_authenticate(user)
+    with CaptureQueriesContext(connection) as context:
+        assert client.get(url, params).status_code == 200
+    return context
+
+
+@pytest.mark.django_db
+def test_basket_lookup_uses_partial_index(orders):
+    buyer, _ = orders
+    context = get("/api/v1/basket", buyer)
+    assert_uses_index(hot_query(context, "backend_order"), "order_basket_idx")
+
+
+@pytest.mark.django_db
+def test_order_list_uses_user_created_index(orders):
+    buyer, _ = orders
+    context = get("/api/v1/order", buyer)
+    assert_uses_index(hot_query(context, "backend_order"),
+                      "order_user_created_idx")
+
+
+@pytest.mark.django_db
+def test_partner_orders_avoid_sequential_scans(orders):
+    _, partner = orders
+    context = get("/api/v1/partner/orders", partner)
+    assert "Seq Scan" not in query_plan(hot_query(context, "backend_order"))
+
+
+@pytest.mark.django_db
+def test_active_shops_use_partial_index(catalog):
+    context = get("/api/v1/shops/")
+    assert_uses_index(hot_query(context, "backend_shop"),
+                      "shop_active_name_idx")
+
+
+@pytest.mark.django_db
+def test_shop_goods_use_shop_index(catalog):
+    shop = Shop.objects.get()
+    with CaptureQueriesContext(connection) as context:
+        list(ProductInfo.objects.filter(shop_id=shop.id)
+             .values_list("external_id", flat=True))
+    assert_uses_index(hot_query(context, "backend_productinfo"),
+                      "product_info_shop_idx")
+
+
+@pytest.mark.django_db
+def test_category_goods_use_category_index(catalog):
+    category = Category.objects.filter(products__isnull=False).first()
+    with CaptureQueriesContext(connection) as context:
+        category.save()
+    sql = next(query["sql"] for query in context.captured_queries
+               if '"backend_product"."category_id" =' in query["sql"])
+    assert_uses_index(sql, "product_category_name_idx")
+
+
+@pytest.mark.django_db
+def test_stored_order_totals_without_distinct(orders, django_user_model):
+    buyer, partner = orders
+    # в заказ попадает товар второго поставщика
+    other = Shop.objects.create(name="Другой магазин", user=(
+        django_user_model.objects.create_user(
+            email="other_email@mail.ru", password="other_pass",
+            is_active=True,
+        )
+    ))
+    product_info = ProductInfo.objects.first()
+    product_info.pk, product_info.shop = None, other
+    product_info.external_id += 1000
+    product_info.save()
+    order = Order.objects.get(state="new")
+    OrderItem.objects.create(order=order, product_info=product_info,
+                             quantity=1)
+
+    items = order.ordered_items.all()
+    # покупатель видит сохраненную сумму заказа, поставщик только
+    # свои позиции: другой магазин в его сумму не попадает
+    for url, user, expected in (
+        ("/api/v1/order", buyer, items),
+        ("/api/v1/partner/orders", partner, items.exclude(
+            product_info__shop=other)),
+    ):
+        client = APIClient()
+        client.force_authenticate(user)
+        with CaptureQueriesContext(connection) as context:
+            data = client.get(url, {"fields": "id,total_sum,item_count"})
+        sql = hot_query(context, "backend_order")
+        assert "DISTINCT" not in sql
+        assert (url == "/api/v1/order") == ("SUM(" not in sql)
+        assert [item["id"] for item in data.json()] == list(
+            Order.objects.exclude(state="basket").values_list("id", flat=True)
+        )
+        totals = {item["id"]: (item["total_sum"], item["item_count"])
+                  for item in data.json()}
+        assert totals[order.id] == (
+            sum(item.quantity * item.price for item in expected),
+            len(expected),
+        )
@@ -0,0 +1,411 @@
+import json
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from backend.facets import facet_counts
+from backend.importer import import_feed, refresh_catalog
+from backend.models import (
+    CatalogItem,
+    Category,
+    Parameter,
+    Product,
+    ProductInfo,
+    ProductParameter,
+    Shop,
+)
+from backend.serializers import ProductInfoSerializer
+from backend.views import ProductInfoView
+
+from .helpers import iter_data, render, streamed
+
+
+def search(text, **params):
+    response = APIClient().get("/api/v1/products", {"q": text, **params})
+    assert response.status_code == 200
+    return response.json()
+
+
+def external_ids(response_json):
+    return {
+        ProductInfo.objects.get(id=item["id"]).external_id
+        for item in response_json["results"]
+    }
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("text, field", [
+    ("XS Max", "name"),
+    ("xs-max", "model"),
+    ("2688x1242", "parameters"),
+])
+def test_search_by_name_model_and_parameters(catalog, text, field):
+    assert external_ids(search(text)) == {catalog["goods"][0]["id"]}
+
+
+@pytest.mark.django_db
+def test_search_tolerates_typos(catalog):
+    smartphones = {item["id"] for item in catalog["goods"]
+                   if item["category"] == 224}
+    assert external_ids(search("смартфоны")) == smartphones
+    assert external_ids(search("смартфн")) >= smartphones
+
+
+@pytest.mark.django_db
+def test_search_ranked_cursor_pagination(catalog):
+    url = "/api/v1/products?q=iphone+xr&page_size=1"
+    first = search("iphone xr")["results"]
+    seen = []
+    while url:
+        response_json = APIClient().get(url).json()
+        seen.extend(item["id"] for item in response_json["results"])
+        url = response_json["next"]
+    assert seen == [item["id"] for item in first]
+    assert len(seen) == len(set(seen))
+
+
+@pytest.mark.django_db
+def test_search_index_follows_admin_changes(catalog):
+    product = Product.objects.get(name=catalog["goods"][0]["name"])
+    product.name = "Смартфон Apple iPhone 15 Pro"
+    product.save()
+    assert external_ids(search("15 Pro")) == {catalog["goods"][0]["id"]}
+
+
+@pytest.mark.django_db
+def test_catalog_follows_parameter_changes(catalog):
+    parameter = Parameter.objects.get(name="Цвет")
+    parameter.name = "Окраска"
+    parameter.save()
+    results = search("", page_size=100)["results"]
+    names = {item["parameter"] for good in results
+             for item in good["product_parameters"]}
+    assert "Окраска" in names
+    assert "Цвет" not in names
+
+    product_parameter = ProductParameter.objects.filter(
+        parameter=parameter).first()
+    product_parameter.delete()
+    item = CatalogItem.objects.get(
+        product_info_id=product_parameter.product_info_id)
+    fragment = json.loads(item.fragment)["product_parameters"]
+    for parameters in (item.parameters, fragment):
+        assert "Окраска" not in {row["parameter"] for row in parameters}
+
+
+@pytest.mark.django_db
+def test_catalog_follows_bulk_deletes(catalog, django_user_model,
+                                      django_capture_on_commit_callbacks):
+    def parameter_names():
+        return {item["parameter"]
+                for good in search("", page_size=100)["results"]
+                for item in good["product_parameters"]}
+
+    # ответ каталога уже в кеше: удаление должно его сбросить
+    assert "Цвет" in parameter_names()
+    with django_capture_on_commit_callbacks(execute=True):
+        Parameter.objects.filter(name="Цвет").delete()
+    assert "Цвет" not in parameter_names()
+    assert not CatalogItem.objects.filter(
+        parameters__contains=[{"parameter": "Цвет"}]).exists()
+
+    assert search("")["results"]
+    with django_capture_on_commit_callbacks(execute=True):
+        django_user_model.objects.filter(shop__isnull=False).delete()
+    assert search("")["results"] == []
+
+
+@pytest.mark.django_db
+def test_catalog_follows_shop_state(catalog, django_assert_max_num_queries):
+    shop = Shop.objects.get()
+    shop.state = False
+    # каталог магазина не пересчитывается, меняется только состояние
+    with django_assert_max_num_queries(3):
+        shop.save()
+    assert not CatalogItem.objects.filter(shop_state=True).exists()
+    assert search("")["results"] == []
+
+
+@pytest.mark.django_db
+def test_filter_by_parameters(catalog):
+    goods = catalog["goods"]
+    expected = {
+        item["id"] for item in goods
+        if item["parameters"].get("Цвет") in ("красный", "черный")
+        and item["parameters"].get("Встроенная память (Гб)") == 256
+    }
+    response = APIClient().get("/api/v1/products", {
+        "param[Цвет]": ["красный", "черный"],
+        "param[Встроенная память (Гб)]": "256",
+    })
+    assert expected
+    assert external_ids(response.json()) == expected
+
+
+@pytest.mark.django_db
+def test_facet_counts(catalog):
+    goods = [item for item in catalog["goods"] if item["category"] == 224]
+    response_json = APIClient().get("/api/v1/products",
+                                    {"category_id": 224}).json()
+    colors = {}
+    for item in goods:
+        color = item["parameters"]["Цвет"]
+        colors[color] = colors.get(color, 0) + 1
+    assert response_json["facets"]["Цвет"] == colors
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("params", [
+    {"in_stock": "true", "price_min": 20000, "price_max": 70000},
+    {"param[Встроенная память (Гб)]": 256},
+    {"q": "XS Max"},
+])
+def test_facet_counts_follow_filters(catalog, params):
+    with CaptureQueriesContext(connection) as context:
+        response_json = APIClient().get("/api/v1/products",
+                                        {**params, "page_size": 100}).json()
+    # фасеты считаются по JSON записей каталога
+    assert not any("backend_productparameter" in query["sql"]
+                   for query in context.captured_queries)
+    colors = {}
+    for item in response_json["results"]:
+        for parameter in item["product_parameters"]:
+            if parameter["parameter"] == "Цвет":
+                colors[parameter["value"]] = (
+                    colors.get(parameter["value"], 0) + 1)
+    assert colors
+    assert response_json["facets"]["Цвет"] == colors
+
+
+@pytest.mark.django_db
+def test_facets_only_on_first_page(catalog):
+    response_json = search("", page_size=2, in_stock="true")
+    assert response_json["facets"]
+    response_json = APIClient().get(response_json["next"]).json()
+    assert response_json["results"]
+    assert "facets" not in response_json
+
+
+@pytest.mark.django_db
+def test_facets_rebuilt_on_reimport(catalog, django_user_model):
+    partner = django_user_model.objects.get(email="partner_email@mail.ru")
+    catalog["goods"] = catalog["goods"][1:]
+    import_feed(iter_data(catalog), partner.id)
+    facets = APIClient().get("/api/v1/products").json()["facets"]
+    assert sum(facets["Цвет"].values()) == sum(
+        "Цвет" in item["parameters"] for item in catalog["goods"]
+    )
+
+
+@pytest.mark.django_db
+def test_facets_follow_deletes(catalog, django_capture_on_commit_callbacks):
+    colors = sum(facet_counts()["Цвет"].values())
+    with django_capture_on_commit_callbacks(execute=True):
+        ProductParameter.objects.filter(parameter__name="Цвет").first(
+        ).delete()
+    assert sum(facet_counts()["Цвет"].values()) == colors - 1
+    with django_capture_on_commit_callbacks(execute=True):
+        ProductInfo.objects.filter(
+            product_parameters__parameter__name="Цвет").first().delete()
+    assert sum(facet_counts()["Цвет"].values()) == colors - 2
+
+
+@pytest.mark.django_db
+def test_price_range_and_in_stock(catalog):
+    expected = {
+        item["id"] for item in catalog["goods"]
+        if 20000 <= item["price"] <= 70000 and item["quantity"] > 0
+    }
+    response = APIClient().get("/api/v1/products", {
+        "price_min": 20000, "price_max": 70000, "in_stock": "true",
+    })
+    assert expected
+    assert external_ids(response.json()) == expected
+
+
+@pytest.mark.django_db
+def test_price_range_rejects_non_numbers(catalog):
+    response = APIClient().get("/api/v1/products", {"price_min": "дешево"})
+    assert response.json()["Status"] is False
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("ordering, key, reverse", [
+    ("price", "price", False),
+    ("-price", "price", True),
+    ("name", "name", False),
+    ("quantity", "quantity", False),
+])
+def test_ordering_cursor_pagination(catalog, ordering, key, reverse):
+    url = f"/api/v1/products?ordering={ordering}&page_size=2"
+    values = []
+    while url:
+        response_json = APIClient().get(url).json()
+        for item in response_json["results"]:
+            values.append(item["product"]["name"] if key == "name"
+                          else item[key])
+        url = response_json["next"]
+    assert len(values) == len(catalog["goods"])
+    assert values == sorted(values, reverse=reverse)
+
+
+@pytest.fixture
+def tied_catalog(db, django_user_model):
+    # больше тысячи одинаковых товаров: значения ключей сортировки
+    # и ранг поиска у всех совпадают
+    partner = django_user_model.objects.create_user(
+        email="tied@mail.ru", password="partner_pass", user_type="shop")
+    shop = Shop.objects.create(name="Связка", user=partner)
+    category = Category.objects.create(id=1, name="Смартфоны")
+    product = Product.objects.create(name="Смартфон Apple iPhone",
+                                     category=category)
+    ProductInfo.objects.bulk_create(
+        ProductInfo(product=product, shop=shop, external_id=number,
+                    model="iphone", quantity=5, price=1000, price_rrc=1000)
+        for number in range(1300)
+    )
+    refresh_catalog(ProductInfo.objects.all())
+    return ProductInfo.objects.count()
+
+
+def walk_pages(url, limit=100):
+    ids = []
+    # зацикленная пагинация упирается в limit страниц
+    for _ in range(limit):
+        if not url:
+            break
+        response_json = APIClient().get(url).json()
+        ids.extend(item["id"] for item in response_json["results"])
+        url = response_json["next"]
+    return ids
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("ordering", ["price", "-price", "quantity", "name"])
+def test_ordering_cursor_pagination_over_ties(tied_catalog, ordering):
+    ids = walk_pages(f"/api/v1/products?ordering={ordering}&page_size=200")
+    assert len(ids) == len(set(ids)) == tied_catalog
+    assert ids == sorted(ids, reverse=ordering.startswith("-"))
+
+
+@pytest.mark.django_db
+def test_search_cursor_pagination_over_equal_ranks(tied_catalog):
+    ids = walk_pages("/api/v1/products?q=iphone&page_size=200")
+    assert len(ids) == len(set(ids)) == tied_catalog
+    assert ids == sorted(ids, reverse=True)
+
+
+@pytest.mark.django_db
+def test_ordering_cursor_seeks_by_index(tied_catalog):
+    url = "/api/v1/products?ordering=price&page_size=200"
+    url = APIClient().get(url).json()["next"]
+    with CaptureQueriesContext(connection) as context:
+        APIClient().get(url)
+    sql = next(query["sql"] for query in context.captured_queries
+               if query["sql"].startswith('SELECT "backend_catalogitem"'))
+    assert "OFFSET" not in sql
+    with connection.cursor() as cursor:
+        cursor.execute("SET LOCAL enable_seqscan = off")
+        cursor.execute(f"EXPLAIN {sql}")
+        plan = "\n".join(row[0] for row in cursor.fetchall())
+    assert "Index Cond: (ROW(" in plan
+
+
+@pytest.mark.django_db
+def test_shop_price_ordering_uses_index(catalog):
+    shop_id = CatalogItem.objects.values_list("shop_id", flat=True)[0]
+    with CaptureQueriesContext(connection) as context:
+        APIClient().get("/api/v1/products",
+                        {"shop_id": shop_id, "ordering": "price"})
+    sql = next(query["sql"] for query in context.captured_queries
+               if query["sql"].startswith('SELECT "backend_catalogitem"'))
+    with connection.cursor() as cursor:
+        cursor.execute("SET LOCAL enable_seqscan = off")
+        cursor.execute("SET LOCAL enable_sort = off")
+        cursor.execute(f"EXPLAIN {sql}")
+        plan = "\n".join(row[0] for row in cursor.fetchall())
+    assert "catalog_item_shop_price_idx" in plan
+    assert "Sort" not in plan
+
+
+@pytest.mark.django_db
+def test_catalog_fragments_match_serializer_output(catalog):
+    product_infos = (
+        ProductInfo.objects.order_by("id")
+        .select_related("product__category")
+        .prefetch_related("product_parameters__parameter")
+    )
+    response = APIClient().get("/api/v1/products", {"page_size": 100})
+    assert response.content == JSONRenderer().render({
+        "next": None,
+        "previous": None,
+        "results": ProductInfoSerializer(product_infos, many=True).data,
+        "facets": facet_counts(),
+    })
+
+
+@pytest.mark.django_db
+def test_catalog_fragments_follow_import(catalog, django_user_model):
+    partner = django_user_model.objects.get(email="partner_email@mail.ru")
+    catalog["goods"][0] = dict(catalog["goods"][0], price=1)
+    import_feed(iter_data(catalog), partner.id)
+    response_json = search("", ordering="price")
+    assert response_json["results"][0]["price"] == 1
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("params", [
+    {"page_size": 100},
+    {"page_size": 2, "ordering": "-price"},
+    {"q": "iphone", "page_size": 2},
+    {"fields": "id,product,price", "ordering": "name", "page_size": 2},
+    {"expand": "", "q": "iphone"},
+])
+def test_catalog_read_paths_are_identical(catalog, params):
+    expected = render(ProductInfoView, "serializer", **params)
+    assert render(ProductInfoView, "values", **params) == expected
+    assert render(ProductInfoView, "fragments", **params) == expected
+
+
+@pytest.mark.django_db
+def test_catalog_sparse_fieldset_skips_parameters(catalog):
+    with CaptureQueriesContext(connection) as context:
+        response = APIClient().get("/api/v1/products",
+                                   {"fields": "id,product,price"})
+    item = response.json()["results"][0]
+    assert list(item) == ["id", "product", "price"]
+    sql = next(query["sql"] for query in context.captured_queries
+               if query["sql"].startswith('SELECT "backend_catalogitem"'))
+    assert '"parameters"' not in sql and '"fragment"' not in sql
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("params", [{"fields": "id,secret"},
+                                    {"expand": "product"}])
+def test_unknown_fieldset_names_rejected(catalog, params):
+    response = APIClient().get("/api/v1/products", params)
+    assert response.json()["Status"] is False
+
+
+@pytest.mark.django_db
+def test_catalog_stream_export(catalog, settings):
+    settings.EXPORT_CHUNK_SIZE = 2
+    product_infos = (
+        ProductInfo.objects.order_by("price", "id")
+        .select_related("product__category")
+        .prefetch_related("product_parameters__parameter")
+    )
+    response = APIClient().get("/api/v1/products",
+                               {"stream": "1", "ordering": "price"})
+    assert streamed(response) == JSONRenderer().render(
+        ProductInfoSerializer(product_infos, many=True).data
+    )
+    response = APIClient().get("/api/v1/products",
+                               {"stream": "1", "fields": "id,price"})
+    assert json.loads(streamed(response)) == [
+        {"id": item.id, "price": item.price}
+        for item in product_infos.order_by("id")
+    ]
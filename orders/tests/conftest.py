@@ -0,0 +1,20 @@
+import pytest
+from django.core.cache import cache
+from silk.collector import DataCollector
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def clear_silk_request():
+    """
+    Silk оставляет последний запрос в потоке, и запросы к базе
+    в следующих тестах профилируются с EXPLAIN
+    """
+    yield
+    DataCollector().clear()